@@ -28,7 +28,8 @@ def get_answer_func():
     from rag.rag_core import answer_with_rag
     return answer_with_rag
 
-@st.cache_data(show_spinner="Loading document index...")
+# Not st.cache_data: that would pickle a private copy of the memory-mapped index per call;
+# rag_core keeps one shared, mtime-invalidated instance per process instead
 def load_index_if_exists(storage_dir: str):
     storage_path = Path(storage_dir)
     if (storage_path / "faiss.index").exists():
@@ -45,14 +46,31 @@ with st.sidebar:
     top_k = st.slider("Top-k retrieval", min_value=2, max_value=10, value=3, step=1)  # Reduced default
     embedding_model = st.selectbox(
         "Embedding model",
-        ["sentence-transformers/all-MiniLM-L6-v2", "sentence-transformers/paraphrase-MiniLM-L6-v2"],
+        [
+            "sentence-transformers/all-MiniLM-L6-v2",
+            "sentence-transformers/paraphrase-MiniLM-L6-v2",
+            "onnx-int8:sentence-transformers/all-MiniLM-L6-v2",
+        ],
         index=0
     )
+    from rag.residency import get_residency, warm_in_background
+    residency = get_residency()
     chat_model = st.selectbox(
         "Chat model", 
         ["llama3.2:1b", "phi3:mini", "llama3.2:3b", "qwen2.5:3b"],  # Fastest models first
         index=0,
-        help="Make sure the model is pulled with: ollama pull <model-name>"
+        format_func=lambda m: f"{m} 🔥" if residency.is_hot(m) else m,
+        help="🔥 = already loaded (no cold start). Make sure the model is pulled with: ollama pull <model-name>"
+    )
+    # Load a newly picked model while the user types, not when the question arrives
+    if st.session_state.get("warmed_model") != chat_model:
+        st.session_state.warmed_model = chat_model
+        if not residency.is_hot(chat_model):
+            warm_in_background([chat_model])
+    compress = st.checkbox(
+        "Compress context",
+        value=False,
+        help="Keep only the sentences most relevant to the question (shorter prompt, faster answers)"
     )
 
     st.divider()
@@ -60,12 +78,14 @@ with st.sidebar:
         with st.spinner("Building search index..."):
             try:
                 ingest = get_ingest_func()
+                rate = st.empty()
                 stats = ingest(
                     data_dir="data",
                     storage_dir="storage",
                     chunk_size=600,  # Even smaller for speed
                     chunk_overlap=50,  # Minimal overlap
                     embedding_model=embedding_model,
+                    progress=lambda p: rate.caption(f"⚡ {p['chunks_per_s']} chunks/s · {p['tokens_per_s']} tokens/s · {p['mb_per_s']} MB/s"),
                 )
                 st.success(f"✅ Ready! {stats['chunks']} chunks from {stats.get('files', 'unknown')} files.")
                 st.rerun()  # Refresh to enable chat
@@ -81,8 +101,9 @@ with st.sidebar:
     # Quick status check
     if st.button("📊 Check Status"):
         try:
-            import requests
-            resp = requests.get("http://127.0.0.1:11434/api/tags", timeout=3)
+            from rag.http_clients import get_session
+            from rag.ollama_pool import ollama_urls
+            resp = get_session().get(f"{ollama_urls()[0]}/api/tags", timeout=3)
             models = resp.json().get("models", []) if resp.status_code == 200 else []
             index_exists = (Path("storage") / "faiss.index").exists()
             
@@ -123,27 +144,36 @@ if question := st.chat_input("Ask about your documents..."):
         st.markdown(question)
 
     with st.chat_message("assistant"):
-        with st.spinner("Searching and answering..."):
-            try:
+        try:
+            stats = {}
+            with st.spinner("Searching..."):
                 answer_with_rag = get_answer_func()
-                answer, retrieved = answer_with_rag(
+                tokens, retrieved = answer_with_rag(
                     question=question,
                     top_k=top_k,
                     storage_dir="storage",
                     embedding_model=embedding_model,
                     chat_model=chat_model,
                     cache_func=load_index_if_exists,
+                    stream=True,
+                    compress=compress,
+                    stats=stats,
                 )
-                st.markdown(answer)
-                sources = [{"source": r.source, "score": r.score, "text": r.text} for r in retrieved]
-                with st.expander("📚 Sources"):
-                    for source in sources:
-                        st.markdown(f"**{source['source']}** (relevance: {source['score']:.2f})")
-                        st.write(source["text"][:200] + "..." if len(source["text"]) > 200 else source["text"])
-                st.session_state.messages.append({"role": "assistant", "content": answer, "sources": sources})
-            except Exception as e:
-                st.error(str(e))
-                if "model" in str(e).lower() and "not found" in str(e).lower():
-                    st.info(f"**Quick fix:** Run `ollama pull {chat_model}` in terminal")
-                else:
-                    st.caption("Check that Ollama is running with the selected model")
+            # Render tokens as Ollama produces them
+            answer = st.write_stream(tokens)
+            if "prompt_tokens" in stats:
+                st.caption(f"⏱️ {stats.get('total_ms', 0):.0f} ms · {stats['prompt_tokens']} prompt tokens")
+            sources = [{"source": r.source, "score": r.score, "text": r.text} for r in retrieved]
+            with st.expander("📚 Sources"):
+                for source in sources:
+                    st.markdown(f"**{source['source']}** (relevance: {source['score']:.2f})")
+                    st.write(source["text"][:200] + "..." if len(source["text"]) > 200 else source["text"])
+            st.session_state.messages.append({"role": "assistant", "content": answer, "sources": sources})
+        except Exception as e:
+            st.error(str(e))
+            if "model" in str(e).lower() and "not found" in str(e).lower():
+                st.info(f"**Quick fix:** Run `ollama pull {chat_model}` in terminal")
+            elif "busy" in str(e).lower():
+                st.caption("Many questions are being answered right now, please ask again in a few seconds")
+            else:
+                st.caption("Check that Ollama is running with the selected model")
@@ -37,13 +37,12 @@ data_dir.mkdir(exist_ok=True)
 @st.cache_resource(show_spinner="Loading AI modules...")
 def get_ingest_func():
     # Import cloud version of ingest that uses OpenAI embeddings
-    import json
-    import numpy as np
     import faiss
     from pathlib import Path
-    from llm_client_cloud import embed_texts
+    from llm_client_cloud import embed_array
     
     def ingest_cloud(data_dir="data", storage_dir="storage", chunk_size=600, chunk_overlap=50, embedding_model="text-embedding-3-small"):
+        from rag.chunk_store import ChunkStoreWriter
         from rag.ingest import build_chunks
         
         data_path = Path(data_dir)
@@ -55,20 +54,16 @@ def get_ingest_func():
             raise RuntimeError(f"No documents found in '{data_path.resolve()}'. Add files to data/ and retry.")
         
         texts = [c.text for c in chunks]
-        vectors = embed_texts(texts, model=embedding_model)
-        
-        vecs = np.array(vectors, dtype=np.float32)
+        vecs = embed_array(texts, model=embedding_model)
         dim = vecs.shape[1]
         index = faiss.IndexFlatIP(dim)
-        
-        faiss.normalize_L2(vecs)
         index.add(vecs)
         
         faiss.write_index(index, str(storage_path / "faiss.index"))
-        (storage_path / "chunks.json").write_text(
-            json.dumps([{"text": c.text, "source": c.source} for c in chunks], ensure_ascii=False, indent=2),
-            encoding="utf-8"
-        )
+        writer = ChunkStoreWriter(storage_path / "chunks.bin")
+        for i, c in enumerate(chunks):
+            writer.add({"id": i, "text": c.text, "source": c.source})
+        writer.close()
         
         return {"chunks": len(chunks), "files": file_count, "embedding_model": embedding_model}
     
@@ -76,28 +71,26 @@ def get_ingest_func():
 
 @st.cache_resource(show_spinner="Loading chat engine...")
 def get_answer_func():
-    from llm_client_cloud import chat_answer, embed_texts
-    import json
-    import numpy as np
+    from llm_client_cloud import chat_answer, embed_array
     import faiss
+    from rag.chunk_store import ChunkStore
     from pathlib import Path
     
     def answer_with_rag_cloud(question, top_k=3, storage_dir="storage", embedding_model="text-embedding-3-small", chat_model="gpt-4o-mini", cache_func=None):
         # Load index
         storage_path = Path(storage_dir)
         index = faiss.read_index(str(storage_path / "faiss.index"))
-        chunks = json.loads((storage_path / "chunks.json").read_text(encoding="utf-8"))
+        chunks = ChunkStore(storage_path / "chunks.bin")
         
         # Search
-        q_vec = np.array(embed_texts([question], model=embedding_model), dtype=np.float32)
-        faiss.normalize_L2(q_vec)
+        q_vec = embed_array([question], model=embedding_model)
         scores, ids = index.search(q_vec, top_k)
         
         # Build context
         context_parts = []
         for score, idx in zip(scores[0], ids[0]):
             if 0 <= idx < len(chunks):
-                chunk = chunks[idx]
+                chunk = chunks.row(idx)
                 context_parts.append(f"[source: {chunk.get('source', 'unknown')}]\n{chunk['text']}")
         
         context = "\n\n".join(context_parts)
@@ -107,7 +100,7 @@ def get_answer_func():
         retrieved = []
         for score, idx in zip(scores[0], ids[0]):
             if 0 <= idx < len(chunks):
-                chunk = chunks[idx]
+                chunk = chunks.row(idx)
                 retrieved.append({
                     "text": chunk["text"], 
                     "source": chunk.get("source", "unknown"), 
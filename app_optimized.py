@@ -51,7 +51,12 @@ with st.sidebar:
     
     embedding_model = st.selectbox(
         "🔤 Embedding Model", 
-        ["all-MiniLM-L6-v2", "paraphrase-MiniLM-L6-v2"]
+        [
+            "sentence-transformers/all-MiniLM-L6-v2",
+            "sentence-transformers/paraphrase-MiniLM-L6-v2",
+            "onnx-int8:sentence-transformers/all-MiniLM-L6-v2",
+        ],
+        format_func=lambda m: m.replace("sentence-transformers/", "")
     )
     
     st.divider()
@@ -61,12 +66,14 @@ with st.sidebar:
         with st.spinner("Building lightning-fast search index..."):
             try:
                 ingest, _, _ = _load_rag_functions()
+                rate = st.empty()
                 stats = ingest(
                     data_dir="data",
                     storage_dir="storage",
                     chunk_size=chunk_size,
                     chunk_overlap=50,
-                    embedding_model=f"sentence-transformers/{embedding_model}"
+                    embedding_model=embedding_model,
+                    progress=lambda p: rate.caption(f"⚡ {p['chunks_per_s']} chunks/s · {p['tokens_per_s']} tokens/s · {p['mb_per_s']} MB/s")
                 )
                 st.success(f"✅ Indexed {stats['chunks']} chunks from {stats.get('files', 0)} files")
                 st.cache_data.clear()  # Clear cache to refresh index status
@@ -85,8 +92,9 @@ with st.sidebar:
     with col2:
         if st.button("📊 Status", use_container_width=True):
             try:
-                import requests
-                resp = requests.get("http://127.0.0.1:11434/api/tags", timeout=2)
+                from rag.http_clients import get_session
+                from rag.ollama_pool import ollama_urls
+                resp = get_session().get(f"{ollama_urls()[0]}/api/tags", timeout=2)
                 models = resp.json().get("models", []) if resp.status_code == 200 else []
                 index_exists = _check_index_exists()
                 
@@ -144,36 +152,38 @@ if prompt := st.chat_input("Ask about your documents..."):
 
     # Generate response
     with st.chat_message("assistant"):
-        with st.spinner("🔍 Searching and generating..."):
-            try:
+        try:
+            with st.spinner("🔍 Searching..."):
                 _, answer_with_rag, get_cached_index = _load_rag_functions()
                 
-                answer, retrieved = answer_with_rag(
+                tokens, retrieved = answer_with_rag(
                     question=prompt,
                     top_k=top_k,
                     storage_dir="storage",
-                    embedding_model=f"sentence-transformers/{embedding_model}",
+                    embedding_model=embedding_model,
                     chat_model=chat_model,
-                    cache_func=get_cached_index
+                    cache_func=get_cached_index,
+                    stream=True
                 )
-                
-                st.markdown(answer)
-                sources = [{"source": r.source, "score": r.score, "text": r.text} for r in retrieved]
-                
-                with st.expander(f"📚 {len(sources)} Sources"):
-                    for src in sources:
-                        st.markdown(f"**{src['source']}** (score: {src['score']:.2f})")
-                        st.write(src["text"][:150] + "..." if len(src["text"]) > 150 else src["text"])
-                
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": answer, 
-                    "sources": sources
-                })
-                
-            except Exception as e:
-                st.error(f"❌ {str(e)}")
-                if "model" in str(e).lower():
-                    st.info(f"💡 Run: `ollama pull {chat_model}`")
-                elif "index" in str(e).lower():
-                    st.info("💡 Click 'Build Index' first")
\ No newline at end of file
+            
+            # Stream tokens as they arrive instead of waiting for the full answer
+            answer = st.write_stream(tokens)
+            sources = [{"source": r.source, "score": r.score, "text": r.text} for r in retrieved]
+            
+            with st.expander(f"📚 {len(sources)} Sources"):
+                for src in sources:
+                    st.markdown(f"**{src['source']}** (score: {src['score']:.2f})")
+                    st.write(src["text"][:150] + "..." if len(src["text"]) > 150 else src["text"])
+            
+            st.session_state.messages.append({
+                "role": "assistant", 
+                "content": answer, 
+                "sources": sources
+            })
+            
+        except Exception as e:
+            st.error(f"❌ {str(e)}")
+            if "model" in str(e).lower():
+                st.info(f"💡 Run: `ollama pull {chat_model}`")
+            elif "index" in str(e).lower():
+                st.info("💡 Click 'Build Index' first")
\ No newline at end of file
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+⚖️ AskAce: D'RAG - Embedding backend comparison (torch vs. ONNX Runtime)
+
+Each backend runs in a fresh subprocess so import time and peak RSS are
+measured from a cold interpreter. Reported per backend: import + model load
+seconds, peak RSS, single-query throughput, and the worst cosine similarity
+of its vectors against the torch model.
+
+    pip install -r requirements-onnx.txt
+    python -m rag.onnx_embedder                 # one-time export (needs torch)
+    python benchmarks/embed_backends.py --queries 500
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ["RAG_EMBED_CACHE"] = "0"
+
+SAMPLE_TEXTS = [
+    "How does the index pick between flat, IVF and HNSW?",
+    "Amdahl's law bounds the speedup of a program by its serial fraction.",
+    "Chunks are embedded in batches and appended to the FAISS index.",
+    "What is the default chunk size?",
+] * 8
+
+
+def child(model: str, queries: int, out_path: str) -> None:
+    """Measure one backend in this (fresh) process and write JSON results"""
+    import resource
+
+    from rag.onnx_embedder import parse_model
+
+    started = time.perf_counter()
+    if parse_model(model):
+        import onnxruntime, tokenizers  # noqa: F401
+    else:
+        import sentence_transformers  # noqa: F401  (pulls in torch)
+    from rag.llm_client import _get_embedder, embed_array
+    imported = time.perf_counter()
+    _get_embedder(model)
+    loaded = time.perf_counter()
+
+    vectors = embed_array(SAMPLE_TEXTS, model=model)
+    embed_array(["warm up"], model=model, persist=False)
+    t = time.perf_counter()
+    for i in range(queries):
+        embed_array([SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] + f" {i}"], model=model, persist=False)
+    qps = queries / (time.perf_counter() - t)
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / 1e6 if sys.platform == "darwin" else rss / 1e3  # bytes on macOS, KiB on Linux
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "import_s": imported - started,
+            "load_s": loaded - imported,
+            "rss_mb": rss_mb,
+            "qps": qps,
+            "vectors": vectors.tolist(),
+        }, f)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--queries", type=int, default=200, help="Single-text encodes timed per backend")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.child, args.queries, args.out)
+        return 0
+
+    import numpy as np
+
+    backends = [args.model, f"onnx:{args.model}", f"onnx-int8:{args.model}"]
+    results = {}
+    for backend in backends:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            out_path = tmp.name
+        try:
+            subprocess.run(
+                [sys.executable, __file__, "--child", backend, "--queries", str(args.queries), "--out", out_path],
+                check=True, cwd=ROOT
+            )
+            with open(out_path, encoding="utf-8") as f:
+                results[backend] = json.load(f)
+        finally:
+            os.unlink(out_path)
+
+    reference = np.array(results[args.model]["vectors"], dtype=np.float32)
+    print(f"\n{'backend':<10} {'import s':>8} {'load s':>7} {'RSS MB':>7} {'queries/s':>9} {'min cos':>8}")
+    for backend, r in results.items():
+        cosine = float((np.array(r["vectors"], dtype=np.float32) * reference).sum(axis=1).min())
+        label = backend.split(":")[0] if ":" in backend else "torch"
+        print(
+            f"{label:<10} {r['import_s']:>8.2f} {r['load_s']:>7.2f} {r['rss_mb']:>7.0f} "
+            f"{r['qps']:>9.1f} {cosine:>8.5f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+📈 AskAce: D'RAG - Embedding throughput vs. worker count
+
+Embeds the same set of chunks with ``EmbeddingPool`` at increasing worker
+counts (one torch thread per worker by default) and reports chunks/s,
+tokens/s, speedup over one worker and parallel efficiency. The embedding
+cache is disabled so every run does the full work.
+
+    python benchmarks/embed_scaling.py --data-dir data --workers 1 2 4 8 16
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ["RAG_EMBED_CACHE"] = "0"
+
+
+def load_texts(data_dir: str, count: int, chunk_size: int) -> list:
+    """Chunks from the corpus, repeated up to ``count`` (synthetic text if empty)"""
+    from rag.ingest import iter_chunks
+
+    texts = [c.text for c in iter_chunks(Path(data_dir), chunk_size=chunk_size, chunk_overlap=0)]
+    if not texts:
+        texts = [f"Synthetic benchmark sentence number {i}. " * (chunk_size // 40) for i in range(512)]
+    return (texts * (count // len(texts) + 1))[:count]
+
+
+def run(texts: list, model: str, workers: int, threads: int, max_batch_tokens: int) -> float:
+    """Seconds to embed ``texts`` with a warm pool of ``workers`` processes"""
+    from rag.embed_pool import EmbeddingPool
+    from rag.ingest import _token_batches
+    from rag.llm_client import token_lengths
+
+    lengths = token_lengths(texts, model=model)
+    batches = [[texts[i] for i in batch] for batch in _token_batches(lengths, max_batch_tokens)]
+    with EmbeddingPool(model, workers, threads) as pool:
+        for _ in pool.embed_batches(batches[:workers]):  # Load the model in every worker
+            pass
+        started = time.perf_counter()
+        for _ in pool.embed_batches(batches):
+            pass
+        return time.perf_counter() - started
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--chunks", type=int, default=4096, help="Chunks embedded per run")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--threads", type=int, default=1, help="Torch threads per worker")
+    parser.add_argument("--max-batch-tokens", type=int, default=8192)
+    args = parser.parse_args(argv)
+
+    from rag.llm_client import token_lengths
+
+    texts = load_texts(args.data_dir, args.chunks, args.chunk_size)
+    tokens = int(token_lengths(texts, model=args.model).sum())
+    print(f"{len(texts)} chunks, {tokens} tokens, {os.cpu_count()} CPUs, {args.threads} thread(s)/worker\n")
+    print(f"{'workers':>7} {'seconds':>8} {'chunks/s':>9} {'tokens/s':>10} {'speedup':>8} {'efficiency':>10}")
+
+    baseline = None
+    for workers in sorted(set(args.workers) | {1}):  # Speedup is relative to one worker
+        seconds = run(texts, args.model, workers, args.threads, args.max_batch_tokens)
+        baseline = baseline or seconds
+        speedup = baseline / seconds
+        print(
+            f"{workers:>7} {seconds:>8.2f} {len(texts) / seconds:>9.1f} {tokens / seconds:>10.0f} "
+            f"{speedup:>7.2f}x {speedup / workers:>9.0%}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+⚖️ AskAce: D'RAG - Runnable check of incremental ingest into IVF and HNSW
+
+Builds a small corpus, embeds it through a stand-in Ollama server and
+ingests it as an IVF and as an HNSW index. Then it edits, adds and deletes
+files and ingests again. Checks that incremental runs re-embed only the
+changed files and edit the index in place: IVF is never retrained, and
+HNSW is rebuilt only when files were deleted or changed. Every changed
+chunk must still be retrievable and no stale vector may remain. Exits
+non-zero on the first failed check.
+
+    python benchmarks/ingest_incremental_check.py
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+os.environ["RAG_EMBED_CACHE"] = "0"
+os.environ["RAG_QUERY_EMBED_CACHE_SIZE"] = "0"
+os.environ["RAG_QUERY_BATCHING"] = "0"
+
+from ollama_standin import StandIn
+
+MODEL = "ollama:all-minilm"
+CHUNK = 100
+
+
+def check(condition: bool, message: str) -> None:
+    if not condition:
+        print(f"❌ {message}")
+        sys.exit(1)
+    print(f"✅ {message}")
+
+
+def write_doc(path: Path, tag: str) -> None:
+    """Eight chunks of exactly ``CHUNK`` characters, unique per ``tag``"""
+    lines = [f"{tag} section {i}: ".ljust(CHUNK - 1, "x") for i in range(8)]
+    path.write_text("\n".join(lines), encoding="utf-8")
+
+
+class Counter:
+    """Wraps a faiss callable and counts the calls made through it"""
+
+    def __init__(self, owner, name: str):
+        self.owner, self.name = owner, name
+        self.original = getattr(owner, name)
+        self.calls = 0
+        counter = self
+
+        def wrapper(*args, **kwargs):
+            counter.calls += 1
+            return counter.original(*args, **kwargs)
+        setattr(owner, name, wrapper)
+
+
+def ingest_round(storage: Path, data: Path, index_type: str) -> dict:
+    from rag.ingest import ingest
+    return ingest(
+        data_dir=data, storage_dir=storage, chunk_size=CHUNK, chunk_overlap=0,
+        embedding_model=MODEL, index_type=index_type, workers=1
+    )
+
+
+def consistent(storage: Path, changed_text: str) -> bool:
+    """Index and chunk store agree, and ``changed_text`` retrieves itself"""
+    import faiss
+    from rag.chunk_store import ChunkStore
+    from rag.rag_core import retrieve
+
+    index = faiss.read_index(str(storage / "faiss.index"))
+    store = ChunkStore(storage / "chunks.bin")
+    count = len(store)
+    store.close()
+    hits = retrieve(question=changed_text, storage_dir=str(storage), top_k=1, embedding_model=MODEL)
+    return index.ntotal == count and hits and hits[0].text == changed_text
+
+
+def main() -> int:
+    import faiss
+
+    server = StandIn()
+    os.environ.pop("OLLAMA_URLS", None)
+    os.environ["OLLAMA_URL"] = server.url
+    train = Counter(faiss.IndexIVFFlat, "train")
+    hnsw = Counter(faiss, "IndexHNSWFlat")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = Path(tmp) / "data"
+        data.mkdir()
+        for i in range(60):
+            write_doc(data / f"doc{i:02d}.txt", f"doc{i:02d}")
+
+        # IVF: 480 chunks, 8 lists
+        storage = Path(tmp) / "ivf"
+        stats = ingest_round(storage, data, "ivf8")
+        check(stats["index_type"] == "ivf" and train.calls == 1, "full IVF ingest trains once")
+
+        write_doc(data / "doc00.txt", "edited")
+        write_doc(data / "new.txt", "added")
+        (data / "doc01.txt").unlink()
+        train.calls = 0
+        embeds = server.calls("/api/embed")
+        stats = ingest_round(storage, data, "ivf8")
+        check(train.calls == 0, "incremental IVF ingest does not retrain")
+        check(
+            stats["files_embedded"] == 2 and stats["files_removed"] == 1 and server.calls("/api/embed") - embeds <= 2,
+            "only the edited and added files are re-embedded"
+        )
+        check(consistent(storage, "edited section 3: ".ljust(CHUNK - 1, "x")), "IVF serves the edit, no stale vectors")
+
+        # HNSW: additions extend the graph, deletions rebuild it
+        storage = Path(tmp) / "hnsw"
+        ingest_round(storage, data, "hnsw")
+        check(hnsw.calls == 1, "full HNSW ingest builds one graph")
+        write_doc(data / "new2.txt", "appended")
+        ingest_round(storage, data, "hnsw")
+        check(hnsw.calls == 1, "add-only incremental HNSW ingest extends the graph in place")
+        check(consistent(storage, "appended section 5: ".ljust(CHUNK - 1, "x")), "HNSW serves the added file")
+        (data / "new.txt").unlink()
+        write_doc(data / "doc02.txt", "rewritten")
+        ingest_round(storage, data, "hnsw")
+        check(hnsw.calls == 2, "HNSW rebuilt once files are deleted or changed")
+        check(consistent(storage, "rewritten section 1: ".ljust(CHUNK - 1, "x")), "rebuilt HNSW has no stale vectors")
+
+    server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
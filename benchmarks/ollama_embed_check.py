@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+⚖️ AskAce: D'RAG - Runnable check of the Ollama embedding backend
+
+Starts a stand-in Ollama server and embeds through ``rag.llm_client`` with
+``ollama:<model>`` and with ``RAG_EMBED_BACKEND=ollama``. Checks batching,
+the request payload, unit-normalized output in input order, and that
+server errors and short responses surface as ``RuntimeError``. Exits
+non-zero on the first failed check.
+
+    python benchmarks/ollama_embed_check.py
+"""
+
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+os.environ["RAG_EMBED_CACHE"] = "0"
+os.environ["RAG_QUERY_EMBED_CACHE_SIZE"] = "0"
+os.environ["RAG_QUERY_BATCHING"] = "0"
+
+from ollama_standin import StandIn, standin_vector
+
+MODEL = "all-minilm"
+
+
+def check(condition: bool, message: str) -> None:
+    if not condition:
+        print(f"❌ {message}")
+        sys.exit(1)
+    print(f"✅ {message}")
+
+
+def main() -> int:
+    import numpy as np
+
+    server = StandIn()
+    os.environ.pop("OLLAMA_URLS", None)
+    os.environ["OLLAMA_URL"] = server.url
+
+    from rag.llm_client import OllamaEmbedder, _backend_model, embed_array, embed_query
+
+    texts = [f"Chunk number {i} about retrieval." for i in range(70)]
+    vectors = embed_array(texts, model=f"ollama:{MODEL}", batch_size=32)
+    embeds = [body for path, body in server.requests if path == "/api/embed"]
+    check([len(body["input"]) for body in embeds] == [32, 32, 6], "texts sent in batches of batch_size")
+    check(
+        all(body["model"] == MODEL and body["truncate"] is True and "keep_alive" in body for body in embeds),
+        "payload names the model, truncates and sends keep_alive"
+    )
+    check(vectors.shape == (70, 8) and vectors.dtype == np.float32, "one float32 row per text")
+    check(np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5), "rows are unit-normalized")
+    expected = np.array([standin_vector(t) for t in texts], dtype=np.float32)
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    check(np.allclose(vectors, expected, atol=1e-5), "rows match the server's vectors in input order")
+
+    os.environ["RAG_EMBED_BACKEND"] = "ollama"
+    check(_backend_model("all-MiniLM-L6-v2") == "ollama:all-minilm", "RAG_EMBED_BACKEND=ollama maps the default model")
+    query = embed_query("Chunk number 3 about retrieval.", model="all-MiniLM-L6-v2")
+    check(np.allclose(query, vectors[3], atol=1e-5), "queries embed through the same backend")
+    del os.environ["RAG_EMBED_BACKEND"]
+
+    for setting, message in (("fail", "server errors raise RuntimeError"),
+                             ("drop", "a reply with too few embeddings raises RuntimeError")):
+        setattr(server, setting, 1)
+        try:
+            OllamaEmbedder(MODEL).encode(["one", "two"])
+            raised = False
+        except RuntimeError:
+            raised = True
+        setattr(server, setting, 0)
+        check(raised, message)
+
+    server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+⚖️ AskAce: D'RAG - Runnable check of multi-server Ollama routing
+
+Starts two stand-in Ollama servers, points OLLAMA_URLS at them and drives
+real chat requests through ``rag.llm_client``. Checks that concurrent
+requests are spread least-loaded, that a failing server is ejected and gets
+no more traffic, that a health check re-admits it once it recovers (it then
+takes over when the other one fails), and that polling alone ejects an
+unreachable endpoint. Exits non-zero on the first failed check.
+
+    python benchmarks/ollama_pool_check.py
+"""
+
+import os
+import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from ollama_standin import StandIn
+
+MODEL = "llama3.2:1b"
+
+
+def check(condition: bool, message: str) -> None:
+    if not condition:
+        print(f"❌ {message}")
+        sys.exit(1)
+    print(f"✅ {message}")
+
+
+def ask(i: int) -> str:
+    from rag.llm_client import chat_answer
+    return chat_answer(question=f"Question {i}?", context="Stand-in context.", model=MODEL)
+
+
+def fail_until_ejected(endpoint) -> None:
+    """Send concurrent pairs so the failing server gets traffic even when it is not the cheapest"""
+    def attempt(i: int) -> None:
+        try:
+            ask(i)
+        except RuntimeError:
+            pass
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for _ in range(10):
+            if not endpoint.healthy:
+                break
+            list(executor.map(attempt, range(2)))
+
+
+def unused_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main() -> int:
+    a, b = StandIn(), StandIn()
+    os.environ["OLLAMA_URLS"] = f"{a.url},{b.url}"
+    os.environ["RAG_OLLAMA_HEALTH_INTERVAL"] = "0"  # Health checks are run explicitly below
+    os.environ["RAG_LLM_CONCURRENCY"] = "0"
+
+    from rag.ollama_pool import OllamaPool, get_pool
+    pool = get_pool()
+    check(pool is not None and len(pool.endpoints) == 2, "OLLAMA_URLS builds a pool of two endpoints")
+    by_url = {e.url: e for e in pool.endpoints}
+
+    # Least-loaded: with equal latency, concurrent requests split evenly
+    a.loaded.add(MODEL)
+    b.loaded.add(MODEL)
+    pool.check_all()
+    a.delay = b.delay = 0.3
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(ask, range(4)))
+    spread = (a.calls("/api/generate"), b.calls("/api/generate"))
+    check(spread == (2, 2), f"4 concurrent requests split least-loaded across both servers {spread}")
+
+    # Eject: requests that hit the failing server error out until it is ejected
+    a.fail = True
+    fail_until_ejected(by_url[a.url])
+    check(not by_url[a.url].healthy, f"failing server ejected after {pool.eject_after} consecutive failures")
+    a.delay = b.delay = 0.0
+    before = a.calls("/api/generate"), b.calls("/api/generate")
+    answers = [ask(i) for i in range(5)]
+    after = a.calls("/api/generate"), b.calls("/api/generate")
+    check(after[0] == before[0] and after[1] == before[1] + 5, "ejected server gets no traffic")
+    check(all(b.url in answer for answer in answers), "healthy server answers every request")
+
+    # Re-admit: a successful health check brings the server back into rotation
+    a.fail = False
+    pool.check_all()
+    check(by_url[a.url].healthy, "recovered server re-admitted by the /api/ps health check")
+    a.delay = b.delay = 0.3
+    b.fail = True
+    fail_until_ejected(by_url[b.url])
+    a.delay = b.delay = 0.0
+    answers = [ask(i) for i in range(3)]
+    check(all(a.url in answer for answer in answers), "re-admitted server takes over when the other one fails")
+    b.fail = False
+
+    # Unreachable endpoint: polling alone ejects it
+    dead = f"http://127.0.0.1:{unused_port()}"
+    probe = OllamaPool([b.url, dead], health_interval=0)
+    probe.check_all()
+    check([e.healthy for e in probe.endpoints] == [True, False], "unreachable endpoint ejected by polling")
+    check(probe.pick(MODEL).url == b.url, "selection skips the unreachable endpoint")
+
+    a.close()
+    b.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+⚖️ AskAce: D'RAG - Stand-in Ollama server for the runnable checks
+
+Serves the endpoints the client uses (/api/ps, /api/tags, /api/version,
+/api/generate, /api/embed) from a background thread, with switches to slow
+it down or make it fail, and records every request it receives.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandIn:
+    """One stand-in server; flip ``fail`` or ``delay`` while it runs"""
+
+    def __init__(self, models=("llama3.2:1b", "all-minilm:latest")):
+        self.models = list(models)
+        self.loaded = set()   # Reported by /api/ps
+        self.delay = 0.0      # Seconds /api/generate and /api/embed take
+        self.fail = False     # Answer every request with HTTP 500
+        self.drop = 0         # Embeddings left out of each /api/embed reply
+        self.requests = []    # (path, JSON body) of every POST
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def calls(self, path: str) -> int:
+        with self._lock:
+            return sum(p == path for p, _ in self.requests)
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, body: dict, status: int = 200) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if standin.fail:
+                    return self.reply({"error": "stand-in failure"}, 500)
+                if self.path == "/api/ps":
+                    return self.reply({"models": [{"name": m, "model": m} for m in sorted(standin.loaded)]})
+                if self.path == "/api/tags":
+                    return self.reply({"models": [{"name": m} for m in standin.models]})
+                if self.path == "/api/version":
+                    return self.reply({"version": "0.0.0-standin"})
+                self.reply({"error": "not found"}, 404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with standin._lock:
+                    standin.requests.append((self.path, body))
+                if standin.fail:
+                    return self.reply({"error": "stand-in failure"}, 500)
+                time.sleep(standin.delay)
+                if self.path == "/api/embed":
+                    texts = [body["input"]] if isinstance(body["input"], str) else body["input"]
+                    standin.loaded.add(body["model"] if ":" in body["model"] else f"{body['model']}:latest")
+                    embeddings = [standin_vector(t) for t in texts][:len(texts) - standin.drop]
+                    return self.reply({"model": body["model"], "embeddings": embeddings})
+                if self.path == "/api/generate":
+                    standin.loaded.add(body["model"])
+                    return self.reply({
+                        "model": body["model"],
+                        "response": f"Answer from {standin.url}",
+                        "done": True,
+                        "prompt_eval_count": 42,
+                        "eval_count": 4,
+                    })
+                self.reply({"error": "not found"}, 404)
+
+        return Handler
+
+
+def standin_vector(text: str, dim: int = 8) -> list:
+    """Deterministic, unnormalized stand-in embedding of a text"""
+    return [(b - 128) / 64 for b in hashlib.sha256(text.encode("utf-8")).digest()[:dim]]
@@ -1,29 +1,60 @@
+import base64
 import os
 from functools import lru_cache
 from typing import List
 
+import numpy as np
 import requests
 
+from rag.http_clients import get_openai_client
 
-def embed_texts(
+
+def embed_array(
     texts: List[str],
     *,
     model: str = "text-embedding-3-small",
-) -> List[List[float]]:
-    """Use OpenAI embeddings for cloud deployment"""
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """Use OpenAI embeddings for cloud deployment, as a (n, dim) float32 array
+
+    Embeddings are requested base64-encoded and decoded straight into the
+    output rows, so no per-float Python objects are created.
+    """
     if not texts:
-        return []
+        return out if out is not None else np.empty((0, 0), dtype=np.float32)
     
-    import openai
-    client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = get_openai_client(os.getenv("OPENAI_API_KEY"))
     
     # Batch process for efficiency
     response = client.embeddings.create(
         model=model,
-        input=texts
+        input=texts,
+        encoding_format="base64"
     )
     
-    return [data.embedding for data in response.data]
+    for i, data in enumerate(response.data):
+        embedding = data.embedding
+        if isinstance(embedding, str):
+            embedding = np.frombuffer(base64.b64decode(embedding), dtype=np.float32)
+        if out is None:
+            out = np.empty((len(texts), len(embedding)), dtype=np.float32)
+        out[i] = embedding
+    
+    # Normalize in place for cosine similarity via inner product
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    norms += 1e-8
+    return np.divide(out, norms, out=out)
+
+
+def embed_texts(
+    texts: List[str],
+    *,
+    model: str = "text-embedding-3-small",
+) -> List[List[float]]:
+    """Use OpenAI embeddings for cloud deployment"""
+    if not texts:
+        return []
+    return embed_array(texts, model=model).tolist()
 
 
 def chat_answer(
@@ -34,8 +65,7 @@ def chat_answer(
     max_tokens: int = 150,
 ) -> str:
     """Use OpenAI chat for cloud deployment"""
-    import openai
-    client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = get_openai_client(os.getenv("OPENAI_API_KEY"))
 
     prompt = f"Context: {context}\n\nQuestion: {question}\n\nAnswer briefly with citations:"
 
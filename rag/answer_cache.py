@@ -0,0 +1,190 @@
+"""Two-tier cache of generated answers
+
+Tier 1 is an exact-key LRU on the normalized question plus everything that
+shapes the answer (top_k, models, context settings, index version), so a
+repeat skips embedding, search and generation. Tier 2 keeps the vectors of
+past questions in a small FAISS inner-product index per scope (the same
+key without the question) and serves a cached answer when a new question's
+cosine similarity reaches ``threshold``.
+
+Entries expire after ``ttl`` seconds. The index version in every key changes
+whenever ``faiss.index`` or ``chunks.bin`` is rewritten, so a rebuild (in
+any process) invalidates older answers; their scopes are dropped on the first
+lookup against the new version.
+
+Configured by ``RAG_ANSWER_CACHE`` (``0`` disables), ``RAG_ANSWER_CACHE_SIZE``
+(1024), ``RAG_ANSWER_CACHE_TTL`` (seconds, 3600) and
+``RAG_ANSWER_CACHE_THRESHOLD`` (0.95).
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Tuple
+import numpy as np
+import faiss
+
+
+@dataclass(frozen=True)
+class CachedAnswer:
+    answer: str
+    retrieved: list
+    expires: float
+
+
+def normalize_question(question: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a question"""
+    return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?!. ")
+
+
+def index_version(storage_dir: str | os.PathLike) -> str:
+    """Changes whenever the index or chunk metadata files are rewritten"""
+    storage_path = Path(storage_dir)
+    meta_path = storage_path / "chunks.bin"
+    if not meta_path.exists():
+        meta_path = storage_path / "chunks.json"  # Legacy metadata
+    try:
+        return f"{(storage_path / 'faiss.index').stat().st_mtime_ns}_{meta_path.stat().st_mtime_ns}"
+    except FileNotFoundError:
+        raise RuntimeError("Index not found. Build index first.")
+
+
+class AnswerCache:
+    """Exact LRU plus semantic nearest-question tier, with TTLs and hit-rate counters"""
+
+    def __init__(self, *, max_entries: int = 1024, ttl: float = 3600.0, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._exact: "OrderedDict[tuple, CachedAnswer]" = OrderedDict()
+        self._scopes = {}  # scope -> (IndexIDMap2, {id: CachedAnswer})
+        self._order: "OrderedDict[int, tuple]" = OrderedDict()  # Semantic id -> scope, oldest first
+        self._next_id = 0
+        self._versions = {}  # storage_dir -> index version of the latest lookup
+        self.exact_hits = self.semantic_hits = self.misses = self.expired = self.invalidated = 0
+
+    def get_exact(self, scope: tuple, question: str) -> CachedAnswer | None:
+        key = (*scope, normalize_question(question))
+        with self._lock:
+            self._drop_stale_scopes(scope)
+            entry = self._exact.get(key)
+            if entry is not None and entry.expires <= time.time():
+                del self._exact[key]
+                self.expired += 1
+                entry = None
+            if entry is not None:
+                self._exact.move_to_end(key)
+                self.exact_hits += 1
+            return entry
+
+    def get_semantic(self, scope: tuple, vector: np.ndarray) -> Tuple[CachedAnswer | None, float]:
+        """Closest live answer in ``scope`` at or above the threshold, with its similarity"""
+        with self._lock:
+            index, entries = self._scopes.get(scope, (None, None))
+            if index is not None and index.ntotal:
+                scores, ids = index.search(np.asarray(vector, dtype=np.float32).reshape(1, -1), min(4, index.ntotal))
+                now = time.time()
+                for score, vid in zip(scores[0], ids[0]):
+                    if vid < 0 or score < self.threshold:
+                        break
+                    entry = entries[int(vid)]
+                    if entry.expires <= now:
+                        self._remove_semantic(int(vid))
+                        self.expired += 1
+                        continue
+                    self.semantic_hits += 1
+                    return entry, float(score)
+            self.misses += 1
+            return None, 0.0
+
+    def put(self, scope: tuple, question: str, vector: np.ndarray, answer: str, retrieved: list) -> None:
+        if not answer.strip():
+            return  # Nothing worth serving again
+        entry = CachedAnswer(answer=answer, retrieved=list(retrieved), expires=time.time() + self.ttl)
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        with self._lock:
+            if self._versions.get(scope[0], scope[1]) != scope[1]:
+                return  # Answered from an index that was rebuilt meanwhile
+            key = (*scope, normalize_question(question))
+            self._exact[key] = entry
+            self._exact.move_to_end(key)
+            while len(self._exact) > self.max_entries:
+                self._exact.popitem(last=False)
+
+            if scope not in self._scopes:
+                self._scopes[scope] = (faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1])), {})
+            index, entries = self._scopes[scope]
+            vid = self._next_id
+            self._next_id += 1
+            index.add_with_ids(vector, np.array([vid], dtype=np.int64))
+            entries[vid] = entry
+            self._order[vid] = scope
+            while len(self._order) > self.max_entries:
+                self._remove_semantic(next(iter(self._order)))
+
+    def _remove_semantic(self, vid: int) -> None:
+        scope = self._order.pop(vid)
+        index, entries = self._scopes[scope]
+        index.remove_ids(np.array([vid], dtype=np.int64))
+        del entries[vid]
+        if not entries:
+            del self._scopes[scope]
+
+    def _drop_stale_scopes(self, scope: tuple) -> None:
+        """Forget entries built on another version of the same storage directory
+        
+        Only runs when the version seen for ``storage_dir`` changes, so a
+        lookup normally costs one dict access here.
+        """
+        storage_dir, version = scope[0], scope[1]
+        if self._versions.get(storage_dir) == version:
+            return
+        self._versions[storage_dir] = version
+        stale = [s for s in self._scopes if s[0] == storage_dir and s[1] != version]
+        for s in stale:
+            for vid in list(self._scopes[s][1]):
+                self._remove_semantic(vid)
+            self.invalidated += 1
+        stale_keys = [k for k in self._exact if k[0] == storage_dir and k[1] != version]
+        for k in stale_keys:
+            del self._exact[k]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "invalidated_scopes": self.invalidated,
+                "exact_entries": len(self._exact),
+                "semantic_entries": len(self._order),
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._exact.clear()
+            self._scopes.clear()
+            self._order.clear()
+            self._versions.clear()
+
+
+@lru_cache(maxsize=1)
+def get_answer_cache() -> AnswerCache | None:
+    """Process-wide cache configured via RAG_ANSWER_CACHE_* (None when disabled)"""
+    if os.getenv("RAG_ANSWER_CACHE", "1").lower() in {"0", "false", "off"}:
+        return None
+    return AnswerCache(
+        max_entries=int(os.getenv("RAG_ANSWER_CACHE_SIZE", "1024")),
+        ttl=float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600")),
+        threshold=float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.95")),
+    )
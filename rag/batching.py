@@ -0,0 +1,83 @@
+"""Dynamic micro-batching of concurrent embedding requests"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, List
+import numpy as np
+
+
+class MicroBatcher:
+    """Coalesce single-text requests from concurrent callers into one forward pass
+
+    A background thread takes the first queued request, keeps collecting for
+    up to ``max_wait_ms`` (or until ``max_batch`` requests), runs ``encode``
+    once and fans the rows back out. Requests that queue up while a batch is
+    running are picked up by the next one, so under load batches form even
+    with ``max_wait_ms=0``; an idle batcher adds at most ``max_wait_ms``.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], *, max_batch: int = 32, max_wait_ms: float = 2.0):
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._largest = 0
+        self._delays = deque(maxlen=1024)  # Recent queue delays in seconds
+        threading.Thread(target=self._run, name="embed-batcher", daemon=True).start()
+
+    def submit(self, text: str) -> Future:
+        """Queue a text; the future resolves to its embedding row"""
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def embed(self, text: str) -> np.ndarray:
+        """Blocking single-text embedding through the batcher"""
+        return self.submit(text).result()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    remaining = deadline - time.perf_counter()
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            started = time.perf_counter()
+            try:
+                vectors = self.encode([text for text, _, _ in batch])
+            except BaseException as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for row, (_, future, _) in enumerate(batch):
+                future.set_result(vectors[row])
+
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._largest = max(self._largest, len(batch))
+                self._delays.extend(started - queued for _, _, queued in batch)
+
+    def stats(self) -> dict:
+        """Batch-size and queue-delay metrics"""
+        with self._lock:
+            delays = np.array(self._delays) * 1000 if self._delays else np.zeros(1)
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+                "max_batch_size": self._largest,
+                "queue_depth": self._queue.qsize(),
+                "queue_delay_ms_avg": round(float(delays.mean()), 3),
+                "queue_delay_ms_p95": round(float(np.percentile(delays, 95)), 3),
+                "max_wait_ms": self.max_wait * 1000,
+            }
@@ -0,0 +1,143 @@
+"""Compact binary chunk metadata store, memory-mapped at load
+
+Layout of ``chunks.bin`` (little endian, sections 8-byte aligned):
+
+    header     magic, row count and section offsets (``_HEADER``)
+    blob       UTF-8 texts of all rows, concatenated
+    offsets    int64[count + 1] byte offsets of each text in the blob
+    ids        int64[count] FAISS vector IDs, ascending
+    sources    int32[count] index into the source table
+    table      JSON list of source names
+
+Opening the store only maps the file, so load time does not grow with the
+corpus; a lookup decodes just the rows it returns.
+"""
+import json
+import mmap
+import os
+import struct
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+import numpy as np
+
+
+_MAGIC = b"ACECHNK1"
+_HEADER = struct.Struct("<8sQQQQQQQ")  # magic, count, blob, offsets, ids, sources, table, table_len
+
+
+def _align(f) -> int:
+    """Pad the file to an 8-byte boundary and return the position"""
+    pos = f.tell()
+    if pos % 8:
+        f.write(b"\0" * (8 - pos % 8))
+    return f.tell()
+
+
+class ChunkStoreWriter:
+    """Stream rows into a new store, replacing the target atomically on close"""
+
+    def __init__(self, path: str | os.PathLike):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.count = 0
+        self._offsets = array("q", [0])
+        self._ids = array("q")
+        self._source_idx = array("i")
+        self._sources: Dict[str, int] = {}
+        self._last_id = -1
+        self._file = self.tmp_path.open("wb")
+        self._file.write(b"\0" * _HEADER.size)
+
+    def add_raw(self, vid: int, text: bytes, source: str) -> None:
+        """Append a row whose text is already UTF-8 encoded"""
+        if vid <= self._last_id:
+            raise ValueError(f"Chunk IDs must be ascending ({vid} after {self._last_id})")
+        self._last_id = vid
+        self._file.write(text)
+        self._offsets.append(self._offsets[-1] + len(text))
+        self._ids.append(vid)
+        self._source_idx.append(self._sources.setdefault(source, len(self._sources)))
+        self.count += 1
+
+    def add(self, chunk: dict) -> None:
+        """Append a ``{"id", "text", "source"}`` row"""
+        self.add_raw(chunk["id"], chunk["text"].encode("utf-8"), chunk.get("source", "unknown"))
+
+    def close(self) -> None:
+        f = self._file
+        sections = []
+        for values in (self._offsets, self._ids, self._source_idx):
+            sections.append(_align(f))
+            f.write(values.tobytes())
+        table = json.dumps(list(self._sources), ensure_ascii=False).encode("utf-8")
+        sections.append(_align(f))
+        f.write(table)
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, self.count, _HEADER.size, *sections, len(table)))
+        f.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class ChunkStore:
+    """Read-only, memory-mapped view of a ``chunks.bin`` file"""
+
+    def __init__(self, path: str | os.PathLike):
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, blob, offsets, ids, sources, table, table_len = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC:
+            raise RuntimeError(f"Not a chunk store: {self.path}")
+        self._blob = blob
+        self._offsets = np.frombuffer(self._mmap, dtype=np.int64, count=count + 1, offset=offsets)
+        self.ids = np.frombuffer(self._mmap, dtype=np.int64, count=count, offset=ids)
+        self._source_idx = np.frombuffer(self._mmap, dtype=np.int32, count=count, offset=sources)
+        self.sources = json.loads(self._mmap[table:table + table_len].decode("utf-8"))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getstate__(self) -> dict:
+        return {"path": str(self.path)}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["path"])
+
+    def _text_bytes(self, row: int) -> bytes:
+        start = self._blob + int(self._offsets[row])
+        end = self._blob + int(self._offsets[row + 1])
+        return self._mmap[start:end]
+
+    def row(self, row: int) -> dict:
+        """Decode a single row by position"""
+        return {
+            "id": int(self.ids[row]),
+            "text": self._text_bytes(row).decode("utf-8"),
+            "source": self.sources[self._source_idx[row]],
+        }
+
+    def find(self, vid: int) -> int:
+        """Row position of a vector ID, or -1"""
+        row = int(np.searchsorted(self.ids, vid))
+        return row if row < len(self.ids) and self.ids[row] == vid else -1
+
+    def get(self, vid: int, default=None) -> dict | None:
+        """Row of a vector ID (dict-like access used by retrieval)"""
+        row = self.find(vid)
+        return self.row(row) if row >= 0 else default
+
+    def iter_raw(self) -> Iterator[Tuple[int, bytes, str]]:
+        """Yield (id, UTF-8 text, source) for every row without decoding"""
+        for row in range(len(self.ids)):
+            yield int(self.ids[row]), self._text_bytes(row), self.sources[self._source_idx[row]]
+
+    def close(self) -> None:
+        """Release the mapping (required before replacing the file on Windows)"""
+        self._offsets = self.ids = self._source_idx = None
+        self._mmap.close()
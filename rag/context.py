@@ -0,0 +1,256 @@
+"""Token-budgeted context packing for the chat prompt
+
+Retrieved chunks are packed in score order until a token budget for the
+chat model is spent. Neighbouring chunks of the same document (consecutive
+IDs) are merged with their shared ``chunk_overlap`` text removed, and
+repeated texts are dropped, so prefill time goes to unique text only.
+
+By default tokens are estimated with a characters-per-token ratio,
+calibrated per model from the ``prompt_eval_count`` Ollama reports after
+each generation. ``RAG_CHAT_TOKENIZER`` opts in to exact counts with the
+``tokenizers`` package: a ``tokenizer.json`` path, a Hugging Face repo id,
+or ``auto`` for the repo matching the chat model's family. Repos are
+downloaded on first use, so nothing is fetched unless asked for; model
+preloading loads the tokenizer too, keeping the download off the first
+request.
+
+``compress_chunks`` optionally shrinks chunks first, keeping only the
+sentences closest to the query vector.
+"""
+import os
+import re
+import threading
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import List, Tuple
+import numpy as np
+
+
+# Ungated tokenizers matching Ollama model families (by name prefix)
+_TOKENIZER_REPOS = {
+    "llama3": "unsloth/Llama-3.2-1B-Instruct",
+    "phi3": "microsoft/Phi-3-mini-4k-instruct",
+    "qwen2.5": "Qwen/Qwen2.5-0.5B-Instruct",
+}
+_DEFAULT_CHARS_PER_TOKEN = 4.0
+_CHARS_PER_TOKEN = {}
+_RATIO_LOCK = threading.Lock()
+_MIN_OVERLAP = 16  # Shorter suffix/prefix matches are treated as coincidence
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\s*\n+\s*")
+
+
+@dataclass(frozen=True)
+class PackedContext:
+    text: str
+    tokens: int
+    chunks: int        # Retrieved chunks represented in the text
+    merged: int        # Chunks merged into a neighbour from the same document
+    duplicates: int    # Chunks dropped as repeats
+    truncated: bool    # Last block was cut to fit the budget
+
+
+@lru_cache(maxsize=8)
+def _tokenizer(model: str):
+    """Tokenizer for a chat model, or None when not configured or not loadable"""
+    spec = os.getenv("RAG_CHAT_TOKENIZER", "").strip()
+    if not spec or spec.lower() == "none":
+        return None
+    if spec.lower() == "auto":
+        spec = next((repo for family, repo in _TOKENIZER_REPOS.items() if model.startswith(family)), None)
+    if not spec:
+        return None
+    try:
+        from tokenizers import Tokenizer
+        return Tokenizer.from_file(spec) if os.path.exists(spec) else Tokenizer.from_pretrained(spec)
+    except Exception:
+        return None  # Offline or package missing: fall back to the calibrated ratio
+
+
+def _chars_per_token(model: str) -> float:
+    return _CHARS_PER_TOKEN.get(model, _DEFAULT_CHARS_PER_TOKEN)
+
+
+def observe_prompt(model: str, prompt: str, prompt_tokens: int) -> None:
+    """Calibrate the fallback ratio with a token count reported by the server"""
+    if not prompt_tokens or _tokenizer(model) is not None:
+        return
+    ratio = len(prompt) / prompt_tokens
+    if not 1.5 <= ratio <= 8.0:
+        return  # Partly cached prompt or a template-only count: not representative
+    with _RATIO_LOCK:
+        _CHARS_PER_TOKEN[model] = 0.8 * _chars_per_token(model) + 0.2 * ratio
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Tokens ``text`` occupies in the prompt of chat ``model``"""
+    tokenizer = _tokenizer(model)
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return round(len(text) / _chars_per_token(model))
+
+
+def truncate_to_tokens(text: str, limit: int, model: str) -> str:
+    """Longest prefix of ``text`` within ``limit`` tokens, cut at a sentence or word end"""
+    tokenizer = _tokenizer(model)
+    if tokenizer is not None:
+        encoding = tokenizer.encode(text, add_special_tokens=False)
+        if len(encoding.ids) <= limit:
+            return text
+        cut = encoding.offsets[limit - 1][1] if limit > 0 else 0
+    else:
+        cut = int(limit * _chars_per_token(model))
+        if cut >= len(text):
+            return text
+
+    head = text[:cut]
+    for boundary in (". ", "\n", " "):
+        end = head.rfind(boundary)
+        if end > cut // 2:
+            return head[:end + 1].rstrip()
+    return head
+
+
+def _merge(first: str, second: str) -> str:
+    """Join consecutive chunks, dropping the longest suffix of ``first`` that starts ``second``"""
+    for size in range(min(len(first), len(second)), _MIN_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first} {second}"
+
+
+class _Block:
+    def __init__(self, chunk):
+        self.source = chunk.source
+        self.first_id = self.last_id = chunk.chunk_id
+        self.text = chunk.text
+
+    def render(self, text: str | None = None) -> str:
+        return f"[{self.source}] {self.text if text is None else text}"
+
+    def adjacent(self, chunk) -> bool:
+        return (
+            chunk.chunk_id >= 0 and self.first_id >= 0 and chunk.source == self.source
+            and chunk.chunk_id in (self.first_id - 1, self.last_id + 1)
+        )
+
+    def merged_text(self, chunk) -> str:
+        if chunk.chunk_id == self.last_id + 1:
+            return _merge(self.text, chunk.text)
+        return _merge(chunk.text, self.text)
+
+
+def pack_context(retrieved: List, *, model: str, budget: int = 300) -> PackedContext:
+    """Pack retrieved chunks (in score order) into at most ``budget`` tokens of context"""
+    blocks: List[_Block] = []
+    costs: List[int] = []
+    seen = set()
+    used = merged = duplicates = 0
+    spent = 0
+    truncated = False
+
+    for chunk in retrieved:
+        key = " ".join(chunk.text.split())
+        if key in seen:
+            duplicates += 1
+            continue
+        seen.add(key)
+
+        target = next((i for i, block in enumerate(blocks) if block.adjacent(chunk)), None)
+        if target is not None:
+            block = blocks[target]
+            text = block.merged_text(chunk)
+            cost = count_tokens(block.render(text), model) + 1
+            if spent - costs[target] + cost > budget:
+                continue  # A smaller chunk further down may still fit
+            spent += cost - costs[target]
+            block.text, costs[target] = text, cost
+            block.first_id = min(block.first_id, chunk.chunk_id)
+            block.last_id = max(block.last_id, chunk.chunk_id)
+            used += 1
+            merged += 1
+            continue
+
+        block = _Block(chunk)
+        cost = count_tokens(block.render(), model) + 1  # +1 for the separator
+        if spent + cost > budget:
+            header = count_tokens(block.render(""), model) + 1
+            remaining = budget - spent - header
+            if remaining < 32 or truncated:
+                continue
+            block.text = truncate_to_tokens(chunk.text, remaining, model)
+            block.first_id = -1  # A cut block cannot absorb neighbours
+            cost = count_tokens(block.render(), model) + 1
+            truncated = True
+        blocks.append(block)
+        costs.append(cost)
+        spent += cost
+        used += 1
+
+    text = "\n\n".join(block.render() for block in blocks)
+    return PackedContext(
+        text=text,
+        tokens=count_tokens(text, model),
+        chunks=used,
+        merged=merged,
+        duplicates=duplicates,
+        truncated=truncated,
+    )
+
+
+def split_sentences(text: str) -> List[str]:
+    """Sentences (and line-separated fragments) of a chunk"""
+    return [part.strip() for part in _SENTENCE_BREAK.split(text) if part.strip()]
+
+
+def compress_chunks(
+    retrieved: List,
+    query_vector: np.ndarray,
+    *,
+    embedding_model: str,
+    chat_model: str,
+    budget: int = 300
+) -> Tuple[List, dict]:
+    """Keep the sentences most similar to the query, within ``budget`` tokens
+    
+    All sentences are embedded in one batch and scored against the query's
+    unit vector; the best ones are kept in their original order inside each
+    chunk. Chunks left without sentences are dropped. Returns the compressed
+    chunks and their size metrics.
+    """
+    from rag.llm_client import embed_array
+    
+    owners, sentences, seen = [], [], set()
+    for i, chunk in enumerate(retrieved):
+        for sentence in split_sentences(chunk.text):
+            key = " ".join(sentence.lower().split())
+            if key not in seen:  # Overlapping chunks repeat sentences
+                seen.add(key)
+                owners.append(i)
+                sentences.append(sentence)
+    
+    tokens_before = sum(count_tokens(chunk.text, chat_model) for chunk in retrieved)
+    if not sentences:
+        return retrieved, {"sentences": 0, "kept": 0, "tokens_before": tokens_before, "tokens_after": tokens_before}
+    
+    scores = embed_array(sentences, model=embedding_model, persist=False) @ np.asarray(query_vector, dtype=np.float32)
+    headers = sum(count_tokens(f"[{chunk.source}] ", chat_model) + 1 for chunk in retrieved)
+    remaining = budget - headers
+    keep = []
+    for j in np.argsort(-scores):
+        cost = count_tokens(sentences[j], chat_model) + 1
+        if cost <= remaining:
+            keep.append(j)
+            remaining -= cost
+    
+    parts = [[] for _ in retrieved]
+    for j in sorted(keep):
+        parts[owners[j]].append(sentences[j])
+    compressed = [replace(chunk, text=" ".join(kept)) for chunk, kept in zip(retrieved, parts) if kept]
+    if not compressed:
+        compressed = retrieved  # Budget below any single sentence: let packing truncate
+    return compressed, {
+        "sentences": len(sentences),
+        "kept": len(keep),
+        "tokens_before": tokens_before,
+        "tokens_after": sum(count_tokens(chunk.text, chat_model) for chunk in compressed),
+    }
@@ -0,0 +1,385 @@
+"""Content-addressed embedding caches
+
+``EmbeddingCache`` persists corpus vectors (SQLite index + memory-mapped
+vectors) across runs and processes. Query-time texts (questions, sentences
+scored for compression) are rarely seen twice and should not evict corpus
+vectors or cost a disk write each, so they go to a small in-process
+``MemoryEmbeddingCache`` instead.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Tuple
+import numpy as np
+
+
+def text_key(text: str) -> str:
+    """Hash of whitespace-normalized text (the tokenizer ignores whitespace runs)"""
+    normalized = " ".join(text.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk cache of normalized float32 vectors keyed by (model id, text hash)
+
+    Vectors of each model live in a fixed-width ``.f32`` file that is
+    memory-mapped and grown by doubling; SQLite maps keys to slots and tracks
+    recency so the least recently used entries are evicted past ``max_entries``.
+    Lookups only note recency in memory; it is written in one transaction per
+    ``touch_batch`` hits, or with the next ``put_many``.
+
+    Several processes may share a cache. Rows are only written while no
+    committed entry points at their slot: ``put_many`` reserves slots (and
+    bumps the model's ``generation`` when it reuses evicted ones) in one
+    transaction, writes the vectors, then maps the keys in a second one.
+    ``get_many`` reads the mapping from one snapshot and drops its hits if
+    the generation moved while it copied rows.
+    """
+
+    def __init__(self, cache_dir: str | os.PathLike, *, max_entries: int = 200_000, touch_batch: int = 4096):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self._touched: Dict[Tuple[str, str], int] = {}  # (model, key) -> last use not yet written
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._blobs: Dict[str, np.memmap] = {}
+        self._db = sqlite3.connect(
+            str(self.cache_dir / "embeddings.sqlite"),
+            check_same_thread=False,
+            isolation_level=None,
+            timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS models (
+                model TEXT PRIMARY KEY, dim INTEGER NOT NULL,
+                capacity INTEGER NOT NULL, next_slot INTEGER NOT NULL,
+                generation INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                model TEXT NOT NULL, key TEXT NOT NULL, slot INTEGER NOT NULL,
+                last_used INTEGER NOT NULL, PRIMARY KEY (model, key)
+            );
+            CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS free_slots (
+                model TEXT NOT NULL, slot INTEGER NOT NULL, PRIMARY KEY (model, slot)
+            );
+        """)
+        columns = {name for _, name, *_ in self._db.execute("PRAGMA table_info(models)")}
+        if "generation" not in columns:  # Cache written before slots were versioned
+            self._db.execute("ALTER TABLE models ADD COLUMN generation INTEGER NOT NULL DEFAULT 0")
+
+    def _blob_path(self, model: str) -> Path:
+        slug = hashlib.sha1(model.encode("utf-8")).hexdigest()[:16]
+        return self.cache_dir / f"{slug}.f32"
+
+    def _blob(self, model: str, dim: int, capacity: int) -> np.memmap:
+        """Memory-map the vector file of a model, remapping if another writer grew it"""
+        blob = self._blobs.get(model)
+        if blob is None or blob.shape[0] < capacity:
+            path = self._blob_path(model)
+            if not path.exists() or path.stat().st_size < capacity * dim * 4:
+                with path.open("ab") as f:
+                    f.truncate(capacity * dim * 4)
+            blob = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, dim))
+            self._blobs[model] = blob
+        return blob
+
+    def _mapped(self, model: str, keys: List[str]) -> Dict[str, int]:
+        """Slots of the keys that have an entry"""
+        slots = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            marks = ",".join("?" * len(batch))
+            slots.update(self._db.execute(
+                f"SELECT key, slot FROM entries WHERE model = ? AND key IN ({marks})",
+                (model, *batch)
+            ).fetchall())
+        return slots
+
+    def _generation(self, model: str) -> int | None:
+        row = self._db.execute("SELECT generation FROM models WHERE model = ?", (model,)).fetchone()
+        return row[0] if row else None
+
+    def get_many(self, model: str, texts: List[str], out: np.ndarray | None = None) -> Tuple[np.ndarray | None, List[int]]:
+        """Look up vectors; returns (array with cached rows filled, indices of misses)"""
+        keys = [text_key(t) for t in texts]
+        with self._lock:
+            self._db.execute("BEGIN")  # One snapshot for the model row and the mapping
+            try:
+                row = self._db.execute(
+                    "SELECT dim, capacity, generation FROM models WHERE model = ?", (model,)
+                ).fetchone()
+                slots = self._mapped(model, keys) if row is not None else {}
+            finally:
+                self._db.execute("COMMIT")
+            if row is None:
+                self.misses += len(texts)
+                return out, list(range(len(texts)))
+            dim, capacity, generation = row
+
+            if out is None:
+                out = np.empty((len(texts), dim), dtype=np.float32)
+            missing = [i for i, k in enumerate(keys) if k not in slots]
+            if len(missing) < len(keys):
+                blob = self._blob(model, dim, capacity)
+                hit_rows = [i for i, k in enumerate(keys) if k in slots]
+                out[hit_rows] = blob[[slots[keys[i]] for i in hit_rows]]
+                if self._generation(model) != generation:
+                    # Evicted slots were handed out while we copied: the rows may belong to other keys
+                    self.misses += len(keys)
+                    return out, list(range(len(keys)))
+                stamp = time.time_ns()
+                for i in hit_rows:
+                    self._touched[model, keys[i]] = stamp
+                if len(self._touched) >= self.touch_batch:
+                    self._db.execute("BEGIN")
+                    try:
+                        self._write_recency()
+                        self._db.execute("COMMIT")
+                    except BaseException:
+                        self._db.execute("ROLLBACK")
+                        raise
+
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+            return out, missing
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray) -> None:
+        """Store vectors for texts, evicting least recently used entries past the cap"""
+        if not texts:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dim = vectors.shape[1]
+        unique = {}
+        for text, vector in zip(texts, vectors):
+            unique[text_key(text)] = vector
+
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT dim, capacity, next_slot FROM models WHERE model = ?", (model,)
+                ).fetchone()
+                if row is None:
+                    capacity, next_slot = 1024, 0
+                    self._db.execute(
+                        "INSERT INTO models (model, dim, capacity, next_slot) VALUES (?, ?, ?, ?)",
+                        (model, dim, capacity, next_slot)
+                    )
+                elif row[0] != dim:
+                    raise RuntimeError(f"Embedding cache dimension mismatch for '{model}': {row[0]} != {dim}")
+                else:
+                    _, capacity, next_slot = row
+
+                keys = list(unique)
+                existing = set(self._mapped(model, keys))
+                new_keys = [k for k in keys if k not in existing]
+
+                stamp = time.time_ns()
+                for k in existing:
+                    self._touched[model, k] = stamp
+                self._write_recency()  # Before evicting, so recent hits survive
+                self._evict(len(new_keys))
+
+                # Reuse freed slots first, then append past the highest used slot
+                free = [s for (s,) in self._db.execute(
+                    "SELECT slot FROM free_slots WHERE model = ? ORDER BY slot LIMIT ?",
+                    (model, len(new_keys))
+                )]
+                self._db.executemany(
+                    "DELETE FROM free_slots WHERE model = ? AND slot = ?",
+                    [(model, s) for s in free]
+                )
+                fresh = len(new_keys) - len(free)
+                slots = free + list(range(next_slot, next_slot + fresh))
+                next_slot += fresh
+                while capacity < next_slot:
+                    capacity *= 2
+                self._db.execute(
+                    "UPDATE models SET capacity = ?, next_slot = ?, generation = generation + ? WHERE model = ?",
+                    (capacity, next_slot, 1 if free else 0, model)
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            if not new_keys:
+                return
+
+            # The reserved slots are unmapped now, so their rows can be written outside a transaction
+            blob = self._blob(model, dim, capacity)
+            blob[slots] = np.stack([unique[k] for k in new_keys])
+            blob.flush()
+
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                taken = set(self._mapped(model, new_keys))  # Stored by another process meanwhile
+                self._db.executemany(
+                    "INSERT INTO entries VALUES (?, ?, ?, ?)",
+                    [(model, k, s, stamp) for k, s in zip(new_keys, slots) if k not in taken]
+                )
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO free_slots VALUES (?, ?)",
+                    [(model, s) for k, s in zip(new_keys, slots) if k in taken]
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _write_recency(self) -> None:
+        """Write pending last-use stamps (inside the caller's transaction)"""
+        if self._touched:
+            self._db.executemany(
+                "UPDATE entries SET last_used = ? WHERE model = ? AND key = ?",
+                [(stamp, model, key) for (model, key), stamp in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _evict(self, incoming: int) -> None:
+        """Drop least recently used entries so that ``incoming`` new ones fit"""
+        count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        overflow = count + incoming - self.max_entries
+        if overflow <= 0:
+            return
+        victims = self._db.execute(
+            "SELECT model, key, slot FROM entries ORDER BY last_used LIMIT ?", (overflow,)
+        ).fetchall()
+        self._db.executemany(
+            "DELETE FROM entries WHERE model = ? AND key = ?",
+            [(m, k) for m, k, _ in victims]
+        )
+        self._db.executemany(
+            "INSERT OR IGNORE INTO free_slots VALUES (?, ?)",
+            [(m, s) for m, _, s in victims]
+        )
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        }
+
+    def clear(self) -> None:
+        """Remove all cached vectors"""
+        with self._lock:
+            self._db.executescript("DELETE FROM entries; DELETE FROM free_slots; DELETE FROM models;")
+            self._touched.clear()
+            for model in list(self._blobs):
+                path = self._blob_path(model)
+                del self._blobs[model]
+                path.unlink(missing_ok=True)
+            self.hits = self.misses = self.evictions = 0
+
+
+class MemoryEmbeddingCache:
+    """In-process LRU with the ``EmbeddingCache`` lookup interface, for query-time texts"""
+
+    def __init__(self, *, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+
+    def get_many(self, model: str, texts: List[str], out: np.ndarray | None = None) -> Tuple[np.ndarray | None, List[int]]:
+        """Look up vectors; returns (array with cached rows filled, indices of misses)"""
+        missing = []
+        with self._lock:
+            for i, text in enumerate(texts):
+                key = (model, text_key(text))
+                vector = self._entries.get(key)
+                if vector is None:
+                    missing.append(i)
+                    continue
+                self._entries.move_to_end(key)
+                if out is None:
+                    out = np.empty((len(texts), len(vector)), dtype=np.float32)
+                out[i] = vector
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return out, missing
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray) -> None:
+        """Store vectors for texts, evicting least recently used entries past the cap"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = (model, text_key(text))
+                self._entries[key] = vector.copy()
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+def get_embedding_cache(storage_dir: str | os.PathLike | None = None) -> EmbeddingCache | None:
+    """Corpus cache of a storage dir, configured via RAG_EMBED_CACHE_*
+
+    Lives in ``<storage_dir>/embed_cache`` unless RAG_EMBED_CACHE_DIR names
+    one directory for all storage dirs. None when disabled, or when neither
+    a storage dir nor RAG_EMBED_CACHE_DIR is given.
+    """
+    if os.getenv("RAG_EMBED_CACHE", "1").lower() in {"0", "false", "off"}:
+        return None
+    cache_dir = os.getenv("RAG_EMBED_CACHE_DIR")
+    if not cache_dir:
+        if storage_dir is None:
+            return None
+        cache_dir = Path(storage_dir) / "embed_cache"
+    return _open_embedding_cache(str(Path(cache_dir).resolve()))
+
+
+@lru_cache(maxsize=None)
+def _open_embedding_cache(cache_dir: str) -> EmbeddingCache:
+    """One process-wide instance per cache directory"""
+    return EmbeddingCache(cache_dir, max_entries=int(os.getenv("RAG_EMBED_CACHE_MAX_ENTRIES", "200000")))
+
+
+@lru_cache(maxsize=1)
+def get_query_embedding_cache() -> MemoryEmbeddingCache | None:
+    """Process-wide query-time cache sized by RAG_QUERY_EMBED_CACHE_SIZE (None when 0)"""
+    max_entries = int(os.getenv("RAG_QUERY_EMBED_CACHE_SIZE", "4096"))
+    if max_entries <= 0:
+        return None
+    return MemoryEmbeddingCache(max_entries=max_entries)
@@ -0,0 +1,103 @@
+"""Multi-process embedding for large ingests
+
+One SentenceTransformer forward pass only keeps a few cores busy, so
+``EmbeddingPool`` starts ``workers`` processes that each load the model and
+pull batches from the pool's shared task queue. They are started on the
+first cache miss, so a fully cached ingest never loads the model. Every worker is pinned to
+``threads`` intra-op threads (default: CPU count / workers) so that
+workers x threads never oversubscribes the machine.
+
+Workers use the ``spawn`` start method: forking a process after torch has
+started its thread pools can deadlock.
+"""
+import multiprocessing
+import os
+from typing import Iterator, List
+import numpy as np
+
+
+_MODEL = None
+
+
+def _init_worker(model: str, threads: int) -> None:
+    """Limit native thread pools, then load the model once per worker"""
+    global _MODEL
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "RAG_ONNX_THREADS"):
+        os.environ[var] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass  # No torch (or interop threads already fixed)
+
+    from rag.llm_client import _get_embedder
+    _MODEL = model
+    _get_embedder(model)
+
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    from rag.llm_client import _encode
+    return _encode(texts, _MODEL, batch_size=len(texts))
+
+
+class EmbeddingPool:
+    """Worker processes holding the embedding model, fed from one shared queue"""
+
+    def __init__(self, model: str, workers: int, threads: int | None = None, *,
+                 storage_dir: str | os.PathLike | None = None):
+        from rag.llm_client import _backend_model
+        self.model = _backend_model(model)
+        self.workers = workers
+        self.storage_dir = storage_dir  # Whose embedding cache to use
+        self.threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        self._pool = None
+
+    def __enter__(self) -> "EmbeddingPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def embed_batches(self, batches: List[List[str]]) -> Iterator[np.ndarray]:
+        """Embed pre-formed batches in parallel, yielding (n, dim) unit vectors in order
+
+        All batches are queued at once so idle workers never wait on a slow
+        one. The embedding cache is consulted here, in the calling process;
+        workers only see the misses.
+        """
+        from rag.embed_cache import get_embedding_cache
+
+        cache = get_embedding_cache(self.storage_dir)
+        jobs = []
+        for texts in batches:
+            vectors, missing = cache.get_many(self.model, texts) if cache else (None, list(range(len(texts))))
+            missing_texts = [texts[i] for i in missing]
+            result = self._workers().apply_async(_encode_batch, (missing_texts,)) if missing else None
+            jobs.append((vectors, missing, missing_texts, result))
+
+        for vectors, missing, missing_texts, result in jobs:
+            if result is None:
+                yield vectors
+                continue
+            computed = result.get()
+            if cache:
+                cache.put_many(self.model, missing_texts, computed)
+            if vectors is None or len(missing) == len(vectors):
+                yield computed
+            else:
+                vectors[missing] = computed
+                yield vectors
+
+    def _workers(self):
+        """The worker processes, started on first use"""
+        if self._pool is None:
+            ctx = multiprocessing.get_context("spawn")
+            self._pool = ctx.Pool(self.workers, initializer=_init_worker, initargs=(self.model, self.threads))
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
@@ -0,0 +1,89 @@
+"""Shared, pooled HTTP clients for the Ollama and OpenAI backends
+
+Every backend call goes through one long-lived client per process (per
+event loop for the async flavors), so TCP/TLS connections are reused via
+keep-alive instead of being opened per request. Pool sizes come from
+``RAG_HTTP_POOL_SIZE`` (default 16 connections per host).
+"""
+import asyncio
+import os
+import threading
+import weakref
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+_LOCK = threading.Lock()
+_ASYNC_CLIENTS = weakref.WeakKeyDictionary()
+_ASYNC_OPENAI_CLIENTS = weakref.WeakKeyDictionary()
+
+
+def pool_size() -> int:
+    """Maximum pooled connections per host"""
+    return int(os.getenv("RAG_HTTP_POOL_SIZE", "16"))
+
+
+def ollama_url() -> str:
+    """Base URL of the Ollama server"""
+    return os.getenv("OLLAMA_URL", "http://127.0.0.1:11434").rstrip("/")
+
+
+@lru_cache(maxsize=1)
+def get_session() -> requests.Session:
+    """Process-wide keep-alive session for synchronous HTTP calls"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size(), pool_block=False)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _httpx_limits():
+    import httpx
+    size = pool_size()
+    return httpx.Limits(max_connections=size, max_keepalive_connections=size, keepalive_expiry=60)
+
+
+def get_async_client():
+    """Keep-alive ``httpx.AsyncClient`` bound to the running event loop"""
+    import httpx
+    loop = asyncio.get_running_loop()
+    with _LOCK:
+        client = _ASYNC_CLIENTS.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(limits=_httpx_limits(), timeout=httpx.Timeout(45, connect=5))
+            _ASYNC_CLIENTS[loop] = client
+    return client
+
+
+@lru_cache(maxsize=4)
+def get_openai_client(api_key: str | None = None):
+    """Cached ``OpenAI`` client (one connection pool per API key)"""
+    import httpx
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, http_client=httpx.Client(limits=_httpx_limits(), timeout=60))
+
+
+def get_async_openai_client(api_key: str | None = None):
+    """Cached ``AsyncOpenAI`` client for the running event loop"""
+    import httpx
+    from openai import AsyncOpenAI
+    loop = asyncio.get_running_loop()
+    with _LOCK:
+        clients = _ASYNC_OPENAI_CLIENTS.setdefault(loop, {})
+        if api_key not in clients:
+            clients[api_key] = AsyncOpenAI(
+                api_key=api_key,
+                http_client=httpx.AsyncClient(limits=_httpx_limits(), timeout=60)
+            )
+        return clients[api_key]
+
+
+def close_clients() -> None:
+    """Close the shared session and drop cached clients (e.g. after forking)"""
+    if get_session.cache_info().currsize:
+        get_session().close()
+    get_session.cache_clear()
+    get_openai_client.cache_clear()
@@ -1,12 +1,23 @@
 """Optimized document ingestion with fast chunking and embedding"""
+import hashlib
 import json
+import multiprocessing
 import os
-from dataclasses import asdict, dataclass
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
 import numpy as np
 import faiss
 
+from rag.chunk_store import ChunkStore, ChunkStoreWriter
+from rag.mapped_index import write_vectors
+
+
+MANIFEST_VERSION = 2
+
 
 @dataclass(frozen=True)
 class Chunk:
@@ -99,88 +110,642 @@ def chunk_text(text: str, *, chunk_size: int = 500, chunk_overlap: int = 50) ->
     return chunks
 
 
-def build_chunks(data_dir: Path, *, chunk_size: int = 500, chunk_overlap: int = 50) -> Tuple[List[Chunk], int]:
+def _file_chunks(path: Path, *, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """Read and chunk a single document, skipping problematic files"""
+    try:
+        content = read_document(path)
+    except Exception:
+        return []
+    if not content.strip():
+        return []
+    return chunk_text(content, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def iter_file_chunks(
+    paths: Sequence[Path],
+    *,
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    workers: int | None = None,
+    timeout: float | None = 120.0
+) -> Iterator[Tuple[Path, List[str] | None]]:
+    """Extract and chunk files in a process pool, yielding results in input order
+    
+    pypdf is pure Python, so parsing runs in ``workers`` processes (default:
+    CPU count) with a bounded number of files in flight. A file that does not
+    finish within ``timeout`` seconds of being awaited yields ``None``; the
+    pool is then replaced (killing the stuck worker) and the other files in
+    flight are resubmitted. Only a timeout can stop a hung parse, so files
+    are parsed in-process only when ``timeout`` is None and ``workers=1``.
+    
+    Workers use the ``spawn`` start method: a forked worker would inherit
+    the caller's signal handlers (e.g. the server's asyncio SIGTERM handler,
+    which ``terminate()`` would then trigger) and any locks held by other
+    threads at fork time.
+    """
+    if not paths:
+        return
+    workers = workers or os.cpu_count() or 1
+    if not timeout and (workers <= 1 or len(paths) <= 1):
+        for path in paths:
+            yield path, _file_chunks(path, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        return
+    
+    kwargs = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    processes = max(1, min(workers, len(paths)))
+    ctx = multiprocessing.get_context("spawn")
+    pool = ctx.Pool(processes=processes)
+    try:
+        pending = deque()
+        todo = iter(paths)
+        while True:
+            # Keep a bounded window in flight so results never pile up in memory
+            for path in todo:
+                pending.append((path, pool.apply_async(_file_chunks, (path,), kwargs)))
+                if len(pending) >= 2 * processes:
+                    break
+            if not pending:
+                break
+            path, result = pending.popleft()
+            try:
+                pieces = result.get(timeout=timeout)
+            except multiprocessing.TimeoutError:
+                # A pool never replaces a stuck worker, so swap in a fresh pool
+                pool.terminate()
+                pool.join()
+                pool = ctx.Pool(processes=processes)
+                pending = deque((p, pool.apply_async(_file_chunks, (p,), kwargs)) for p, _ in pending)
+                pieces = None
+            yield path, pieces
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def iter_chunks(
+    data_dir: Path,
+    *,
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    workers: int | None = None,
+    timeout: float | None = 120.0
+) -> Iterator[Chunk]:
+    """Stream chunks of all documents in directory in deterministic order"""
+    paths = sorted(_find_documents(data_dir))
+    for path, pieces in iter_file_chunks(
+        paths, chunk_size=chunk_size, chunk_overlap=chunk_overlap, workers=workers, timeout=timeout
+    ):
+        for piece in pieces or []:
+            yield Chunk(text=piece, source=path.name)
+
+
+def build_chunks(
+    data_dir: Path,
+    *,
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    workers: int | None = None,
+    timeout: float | None = 120.0
+) -> Tuple[List[Chunk], int]:
     """Build chunks from all documents in directory"""
     chunks = []
     file_count = 0
     
-    for file_path in _find_documents(data_dir):
-        try:
-            content = read_document(file_path)
-            if content.strip():
-                file_count += 1
-                for piece in chunk_text(content, chunk_size=chunk_size, chunk_overlap=chunk_overlap):
-                    chunks.append(Chunk(text=piece, source=file_path.name))
-        except Exception:
-            continue  # Skip problematic files
+    paths = sorted(_find_documents(data_dir))
+    for path, pieces in iter_file_chunks(
+        paths, chunk_size=chunk_size, chunk_overlap=chunk_overlap, workers=workers, timeout=timeout
+    ):
+        if pieces:
+            file_count += 1
+            chunks.extend(Chunk(text=piece, source=path.name) for piece in pieces)
     
     return chunks, file_count
 
 
+def _hash_file(path: Path) -> str:
+    """SHA-256 of file contents, read in blocks"""
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_manifest(manifest_path: Path) -> dict | None:
+    """Load ingest manifest, ignoring missing or unreadable files"""
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def _write_atomic(path: Path, data: str) -> None:
+    """Write text via a temp file so readers never see a partial file"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(data, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _throughput(chunks: int, tokens: int, bytes_read: int, started: float) -> dict:
+    """Ingest rate since ``started`` (a perf_counter timestamp)"""
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    return {
+        "seconds": round(elapsed, 3),
+        "chunks_per_s": round(chunks / elapsed, 1),
+        "tokens_per_s": round(tokens / elapsed, 1),
+        "mb_per_s": round(bytes_read / elapsed / 1e6, 2),
+    }
+
+
+def _token_batches(lengths: np.ndarray, max_tokens: int, max_rows: int = 256) -> List[np.ndarray]:
+    """Group positions into length-sorted batches whose padded size fits ``max_tokens``
+    
+    A batch costs (rows x longest row) tokens once padded, so sorting keeps
+    similar lengths together and lets short chunks fill larger batches.
+    """
+    order = np.argsort(lengths, kind="stable")
+    batches = []
+    start = 0
+    for end in range(1, len(order) + 1):
+        rows = end - start
+        if rows > 1 and (rows > max_rows or lengths[order[end - 1]] * rows > max_tokens):
+            batches.append(order[start:end - 1])
+            start = end - 1
+    if start < len(order):
+        batches.append(order[start:])
+    return batches
+
+
+def _parse_index_type(index_type: str, count: int) -> Tuple[str, int | None]:
+    """Resolve an index spec ("auto", "flat", "ivf[nlist]", "hnsw[M]") for ``count`` vectors"""
+    spec = index_type.lower().strip()
+    if spec == "auto":
+        if count < 20_000:
+            return "flat", None
+        if count < 200_000:
+            return "hnsw", None
+        return "ivf", None
+    
+    for kind in ("flat", "ivf", "hnsw"):
+        if spec.startswith(kind):
+            param = spec[len(kind):]
+            if kind == "flat" and param:
+                break
+            if param and not param.isdigit():
+                break
+            return kind, int(param) if param else None
+    
+    raise ValueError(f"Unknown index type '{index_type}'. Use auto, flat, ivf[nlist] or hnsw[M].")
+
+
+def _index_kind(index) -> str:
+    """"flat", "ivf" or "hnsw" for an index (ID-mapped or not)"""
+    inner = faiss.downcast_index(index.index if isinstance(index, faiss.IndexIDMap) else index)
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def _index_vectors(index) -> Tuple[np.ndarray, np.ndarray]:
+    """Stored vectors and IDs of an index of any supported type, sorted by ID"""
+    if isinstance(index, faiss.IndexIDMap):
+        ids = faiss.vector_to_array(index.id_map)
+        inner = faiss.downcast_index(index.index)
+        if isinstance(inner, faiss.IndexIVF):
+            inner.make_direct_map()
+        vectors = inner.reconstruct_n(0, inner.ntotal)
+    else:
+        # IVF storing its own IDs in the inverted lists
+        ivf = faiss.downcast_index(index)
+        lists = ivf.invlists
+        ids = np.concatenate([np.empty(0, dtype=np.int64)] + [
+            faiss.rev_swig_ptr(lists.get_ids(i), lists.list_size(i)).copy()
+            for i in range(ivf.nlist) if lists.list_size(i)
+        ])
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        vectors = ivf.reconstruct_batch(ids) if len(ids) else np.empty((0, ivf.d), dtype=np.float32)
+    if np.any(np.diff(ids) <= 0):
+        order = np.argsort(ids)
+        ids, vectors = ids[order], vectors[order]
+    return vectors, ids
+
+
+def _flat_vectors(index) -> Tuple[np.ndarray, np.ndarray]:
+    """Zero-copy view of an ID-mapped flat index's vectors (valid while it lives), and its IDs"""
+    inner = faiss.downcast_index(index.index)
+    vectors = faiss.rev_swig_ptr(inner.get_xb(), inner.ntotal * inner.d)
+    return vectors.reshape(inner.ntotal, inner.d), faiss.vector_to_array(index.id_map)
+
+
+def _ivf_nlist(count: int, param: int | None = None) -> int:
+    """~4*sqrt(n) lists, keeping >= 39 training points per centroid"""
+    nlist = param or int(4 * np.sqrt(count))
+    return max(1, min(nlist, count // 39))
+
+
+def _editable_index(index, stale_ids: List[int]):
+    """Existing index in a form ``remove_ids``/``add_with_ids`` can update in place
+    
+    IVF indexes keep their trained quantizer and store IDs in their inverted
+    lists (``IndexIDMap2`` cannot remove from an IVF correctly). HNSW cannot
+    delete, so it is staged in a flat index when files were removed or changed.
+    """
+    kind = _index_kind(index)
+    if kind == "ivf" and isinstance(index, faiss.IndexIDMap):
+        vectors, ids = _index_vectors(index)  # Layout of older ingests
+        ivf = faiss.downcast_index(index.index)
+        index.own_fields = False  # The IVF outlives its old wrapper
+        ivf.this.own(True)
+        ivf.reset()
+        ivf.set_direct_map_type(faiss.DirectMap.NoMap)  # Set up by _index_vectors; blocks adding by ID
+        ivf.add_with_ids(vectors, ids)
+        index = ivf
+    elif kind == "hnsw" and stale_ids:
+        vectors, ids = _index_vectors(index)
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(index.d))
+        index.add_with_ids(vectors, ids)
+    return index
+
+
+def _build_index(index, index_type: str) -> Tuple[object, str]:
+    """Bring the updated index into the requested search structure
+    
+    An index that already has the requested structure is kept as edited, so
+    an incremental ingest costs about the changed files: IVF keeps its
+    trained quantizer unless the corpus outgrew it (ideal ``nlist`` off by
+    more than 2x) and HNSW keeps its graph. Otherwise the structure is built
+    from the stored vectors (IVF training included).
+    """
+    kind, param = _parse_index_type(index_type, index.ntotal)
+    current = _index_kind(index)
+    if kind == current:
+        if kind == "flat":
+            return index, kind
+        if kind == "hnsw" and param in (None, faiss.downcast_index(index.index).hnsw.nb_neighbors(1)):
+            return index, kind
+        if kind == "ivf":
+            nlist = faiss.downcast_index(index).nlist
+            ideal = _ivf_nlist(index.ntotal, param)
+            if (nlist == ideal) if param else (nlist / 2 <= ideal <= nlist * 2):
+                return index, kind
+    
+    vectors, ids = _index_vectors(index)
+    count, dim = vectors.shape
+    
+    if kind == "flat":
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    elif kind == "hnsw":
+        inner = faiss.IndexHNSWFlat(dim, param or 32, faiss.METRIC_INNER_PRODUCT)
+        inner.hnsw.efConstruction = 80
+        inner.hnsw.efSearch = 64
+        index = faiss.IndexIDMap2(inner)
+    else:
+        nlist = _ivf_nlist(count, param)
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        sample = vectors
+        if count > 256 * nlist:
+            rows = np.random.default_rng(0).choice(count, 256 * nlist, replace=False)
+            sample = vectors[np.sort(rows)]
+        index.train(sample)
+        index.nprobe = min(nlist, 16)
+    
+    index.add_with_ids(vectors, ids)
+    return index, kind
+
+
+def _plan_files(data_path: Path, old_files: Dict[str, dict]) -> Tuple[Dict[str, dict], List[Tuple[str, Path, str]]]:
+    """Split documents into unchanged manifest entries and files to (re)embed"""
+    kept = {}
+    changed = []
+    
+    for file_path in sorted(_find_documents(data_path)):
+        rel = file_path.relative_to(data_path).as_posix()
+        stat = file_path.stat()
+        entry = old_files.get(rel)
+        
+        # Size and mtime match: trust the manifest without hashing
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            kept[rel] = entry
+            continue
+        
+        digest = _hash_file(file_path)
+        if entry and entry["sha256"] == digest:
+            kept[rel] = {**entry, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            continue
+        
+        changed.append((rel, file_path, digest))
+    
+    return kept, changed
+
+
+class IngestBusy(RuntimeError):
+    """Another process is already ingesting into the same storage directory"""
+
+
+@contextmanager
+def _storage_lock(storage_path: Path) -> Iterator[None]:
+    """Exclusive, non-blocking lock on ``.ingest.lock`` shared by all processes"""
+    handle = open(storage_path / ".ingest.lock", "a+b")
+    try:
+        try:
+            if os.name == "nt":
+                import msvcrt
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            raise IngestBusy(f"Ingest already running for {storage_path}")
+        yield
+    finally:
+        handle.close()  # Releases the lock
+
+
 def ingest(
     *,
     data_dir: str | os.PathLike = "data",
     storage_dir: str | os.PathLike = "storage",
     chunk_size: int = 500,
     chunk_overlap: int = 50,
-    embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
+    incremental: bool = True,
+    workers: int | None = None,
+    extract_timeout: float | None = 120.0,
+    progress: Callable[[dict], None] | None = None,
+    index_type: str = "auto",
+    max_batch_tokens: int = 8192,
+    embed_workers: int = 1
+) -> dict:
+    """Optimized document ingestion pipeline
+    
+    With ``incremental=True`` a manifest of every source file (size, mtime,
+    content hash and owned vector IDs) is kept next to the index, so only new
+    or modified files are embedded and vectors of deleted files are removed.
+    A change of chunking or embedding settings forces a full rebuild.
+    
+    Documents are parsed by ``workers`` processes (see ``iter_file_chunks``);
+    files that exceed ``extract_timeout`` are left out of the manifest so the
+    next run retries them.
+    
+    The pipeline streams: chunks are embedded and appended to the index and
+    metadata file in batches, so memory is bounded by the batch size rather
+    than the corpus. ``progress`` receives throughput stats after each batch.
+    Each window of chunks is sorted by token length and split into batches of
+    at most ``max_batch_tokens`` padded tokens, then put back in order.
+    ``embed_workers > 1`` spreads those batches over an ``EmbeddingPool`` of
+    model-holding processes (``0`` = one per CPU core).
+    
+    ``index_type`` selects the search structure: ``flat`` (exact), ``ivf``
+    or ``ivf<nlist>`` (trained inverted lists), ``hnsw`` or ``hnsw<M>``
+    (graph), or ``auto`` to pick by chunk count. Vectors are staged in a flat
+    index and converted at the end, so changing the type never re-embeds.
+    
+    Only one ingest at a time may write a storage directory, across
+    processes; a concurrent call raises ``IngestBusy``.
+    """
+    storage_path = Path(storage_dir)
+    storage_path.mkdir(parents=True, exist_ok=True)
+    with _storage_lock(storage_path):
+        return _ingest(
+            data_dir=data_dir,
+            storage_dir=storage_dir,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            embedding_model=embedding_model,
+            incremental=incremental,
+            workers=workers,
+            extract_timeout=extract_timeout,
+            progress=progress,
+            index_type=index_type,
+            max_batch_tokens=max_batch_tokens,
+            embed_workers=embed_workers,
+        )
+
+
+def _ingest(
+    *,
+    data_dir: str | os.PathLike = "data",
+    storage_dir: str | os.PathLike = "storage",
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
+    incremental: bool = True,
+    workers: int | None = None,
+    extract_timeout: float | None = 120.0,
+    progress: Callable[[dict], None] | None = None,
+    index_type: str = "auto",
+    max_batch_tokens: int = 8192,
+    embed_workers: int = 1
 ) -> dict:
-    """Optimized document ingestion pipeline"""
-    from rag.llm_client import embed_texts
+    """``ingest`` body, run under the storage lock"""
+    from rag.llm_client import embed_array, token_lengths
     
     # Setup paths
     data_path = Path(data_dir)
     storage_path = Path(storage_dir)
     storage_path.mkdir(parents=True, exist_ok=True)
     
-    # Build chunks
-    chunks, file_count = build_chunks(
-        data_path, 
-        chunk_size=chunk_size, 
-        chunk_overlap=chunk_overlap
-    )
-    
-    if not chunks:
-        raise RuntimeError(
-            f"No documents found in '{data_path.resolve()}'. "
-            f"Add .txt, .md, .pdf, or .docx files and retry."
-        )
+    index_path = storage_path / "faiss.index"
+    meta_path = storage_path / "chunks.bin"
+    manifest_path = storage_path / "manifest.json"
     
-    # Generate embeddings in batches for memory efficiency
-    batch_size = 32
-    all_vectors = []
-    texts = [c.text for c in chunks]
+    settings = {
+        "embedding_model": embedding_model,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+    }
     
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i + batch_size]
-        vectors = embed_texts(batch, model=embedding_model)
-        all_vectors.extend(vectors)
+    # Reuse the existing index only if it was built with the same settings
+    manifest = _load_manifest(manifest_path) if incremental else None
+    index = None
+    if (
+        manifest
+        and all(manifest.get(k) == v for k, v in settings.items())
+        and index_path.exists()
+        and meta_path.exists()
+    ):
+        index = faiss.read_index(str(index_path))
+        if not isinstance(index, faiss.IndexIDMap2) and _index_kind(index) != "ivf":
+            index = None  # Legacy index without stable IDs
     
-    # Create FAISS index
-    vectors_array = np.array(all_vectors, dtype=np.float32)
-    dim = vectors_array.shape[1]
+    if index is None:
+        manifest = {"next_id": 0, "files": {}}
     
-    # Use IndexFlatIP for best accuracy with cosine similarity
-    index = faiss.IndexFlatIP(dim)
-    index.add(vectors_array)
+    kept, changed = _plan_files(data_path, manifest["files"])
     
-    # Save index and metadata
-    index_path = storage_path / "faiss.index"
-    meta_path = storage_path / "chunks.json"
+    # Drop vectors owned by modified and deleted files
+    stale_ids = [
+        vid
+        for rel, entry in manifest["files"].items()
+        if rel not in kept
+        for vid in entry["ids"]
+    ]
+    if index is not None:
+        index = _editable_index(index, stale_ids)
+        if stale_ids:
+            index.remove_ids(np.array(stale_ids, dtype=np.int64))
     
-    faiss.write_index(index, str(index_path))
+    writer = ChunkStoreWriter(meta_path)
+    pool = None
+    try:
+        # Unchanged chunks keep their IDs and come first, so rows stay sorted by ID
+        if kept:
+            kept_ids = {vid for entry in kept.values() for vid in entry["ids"]}
+            old_store = ChunkStore(meta_path)
+            for vid, text, source in old_store.iter_raw():
+                if vid in kept_ids:
+                    writer.add_raw(vid, text, source)
+            old_store.close()
+        
+        # Stream new and modified files through chunking, embedding and indexing
+        embed_workers = embed_workers or os.cpu_count() or 1
+        if embed_workers > 1 and changed:
+            from rag.embed_pool import EmbeddingPool
+            pool = EmbeddingPool(embedding_model, embed_workers, storage_dir=storage_path)
+        window_size = 512 * (embed_workers if pool else 1)  # Enough batches to keep every worker busy
+        next_id = manifest["next_id"]
+        files = dict(kept)
+        pending = []
+        embedded = 0
+        tokens = 0
+        bytes_read = 0
+        started = time.perf_counter()
+        
+        buffer = scratch = None  # Reused (window, dim) output and per-batch arrays
+        
+        def flush():
+            nonlocal index, embedded, tokens, buffer, scratch
+            texts = [c["text"] for c in pending]
+            lengths = token_lengths(texts, model=embedding_model)
+            batches = _token_batches(lengths, max_batch_tokens)
+            if pool is not None:
+                results = pool.embed_batches([[texts[i] for i in batch] for batch in batches])
+            else:
+                results = (
+                    embed_array(
+                        [texts[i] for i in batch],
+                        model=embedding_model,
+                        out=scratch[:len(batch)] if scratch is not None else None,
+                        batch_size=len(batch),
+                        storage_dir=storage_path
+                    )
+                    for batch in batches
+                )
+            for batch, vectors in zip(batches, results):
+                if buffer is None:
+                    buffer = np.empty((window_size, vectors.shape[1]), dtype=np.float32)
+                    scratch = np.empty_like(buffer)
+                buffer[batch] = vectors  # Back to document order
+                embedded += len(batch)
+                tokens += int(lengths[batch].sum())
+                if progress:
+                    progress(_throughput(embedded, tokens, bytes_read, started))
+            
+            if index is None:
+                # Use IndexFlatIP for best accuracy with cosine similarity
+                index = faiss.IndexIDMap2(faiss.IndexFlatIP(buffer.shape[1]))
+            index.add_with_ids(buffer[:len(pending)], np.array([c["id"] for c in pending], dtype=np.int64))
+            for chunk in pending:
+                writer.add(chunk)
+            pending.clear()
+        
+        digests = {file_path: (rel, digest) for rel, file_path, digest in changed}
+        for file_path, pieces in iter_file_chunks(
+            list(digests),
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            workers=workers,
+            timeout=extract_timeout
+        ):
+            if pieces is None:
+                continue  # Timed out: retry on the next ingest
+            rel, digest = digests[file_path]
+            stat = file_path.stat()
+            bytes_read += stat.st_size
+            files[rel] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": digest,
+                "ids": list(range(next_id, next_id + len(pieces))),
+            }
+            for piece in pieces:
+                pending.append({"id": next_id, "text": piece, "source": file_path.name})
+                next_id += 1
+                if len(pending) >= window_size:
+                    flush()
+        if pending:
+            flush()
+        if pool is not None:
+            pool.close()  # Free the workers' models before building the index
+        
+        if not writer.count:
+            raise RuntimeError(
+                f"No documents found in '{data_path.resolve()}'. "
+                f"Add .txt, .md, .pdf, or .docx files and retry."
+            )
+        
+        index, kind = _build_index(index, index_type)
+        
+        # Flat indexes also get a raw vector file for memory-mapped serving
+        vectors_path = storage_path / "vectors.npy"
+        staged_vectors_path = vectors_path.with_name("vectors.staged.npy")
+        if kind == "flat":
+            vectors, ids = _flat_vectors(index)
+            order = np.argsort(ids) if np.any(np.diff(ids) <= 0) else None
+            write_vectors(staged_vectors_path, vectors, order)
+            del vectors, ids, order
+        tmp_index_path = index_path.with_name(index_path.name + ".tmp")
+        faiss.write_index(index, str(tmp_index_path))
+        
+        # Swap the files in with the manifest removed, so readers never pair
+        # files from different versions (manifest last: a crash forces a rebuild)
+        manifest_path.unlink(missing_ok=True)
+        from rag.rag_core import clear_index_cache
+        clear_index_cache()  # Mapped files cannot be replaced on Windows
+        
+        if kind == "flat":
+            os.replace(staged_vectors_path, vectors_path)
+        else:
+            vectors_path.unlink(missing_ok=True)
+        os.replace(tmp_index_path, index_path)
+        writer.close()
+        (storage_path / "chunks.json").unlink(missing_ok=True)  # Legacy metadata
+    except BaseException:
+        writer.abort()
+        for leftover in (storage_path / "vectors.staged.npy", index_path.with_name(index_path.name + ".tmp")):
+            leftover.unlink(missing_ok=True)
+        if pool is not None:
+            pool.close()
+        raise
     
-    chunk_data = [asdict(chunk) for chunk in chunks]
-    meta_path.write_text(
-        json.dumps(chunk_data, ensure_ascii=False, indent=2),
-        encoding="utf-8"
-    )
+    _write_atomic(manifest_path, json.dumps({
+        "version": MANIFEST_VERSION,
+        **settings,
+        "dim": index.d,
+        "index_type": kind,
+        "next_id": next_id,
+        "files": files,
+    }, indent=2))
     
     return {
-        "chunks": len(chunks),
-        "files": file_count,
-        "dim": dim,
+        "chunks": writer.count,
+        "files": sum(1 for entry in files.values() if entry["ids"]),
+        "dim": index.d,
+        "index_type": kind,
         "embedding_model": embedding_model,
         "index_path": str(index_path),
-        "meta_path": str(meta_path)
+        "meta_path": str(meta_path),
+        "files_skipped": len(kept),
+        "files_embedded": len(changed),
+        "files_removed": len(manifest["files"].keys() - files.keys()),
+        "chunks_embedded": embedded,
+        "tokens_embedded": tokens,
+        **_throughput(embedded, tokens, bytes_read, started),
     }
@@ -1,14 +1,128 @@
 """Optimized LLM client for local embeddings and Ollama chat"""
+import json
 import os
+import threading
 from functools import lru_cache
-from typing import List
+from typing import AsyncIterator, Iterator, List
 import numpy as np
 import requests
 
+from rag.http_clients import get_async_client, get_session
+from rag.ollama_pool import ollama_endpoint, ollama_endpoint_async
+from rag.residency import get_residency
+from rag.scheduler import backend_slot, backend_slot_async
+
+
+# sentence-transformers names of models Ollama serves under its own name
+_OLLAMA_ALIASES = {
+    "sentence-transformers/all-MiniLM-L6-v2": "all-minilm",
+    "all-MiniLM-L6-v2": "all-minilm",
+}
+
+
+class OllamaEmbedder:
+    """Embeddings from Ollama's batched ``/api/embed`` endpoint
+    
+    Keeps torch out of the calling process: every worker shares the model
+    loaded once by the Ollama server. Quacks like ``SentenceTransformer``
+    for the parts ``_encode`` uses.
+    """
+    
+    def __init__(self, model: str):
+        self.model = model
+    
+    def token_lengths(self, texts: List[str]) -> np.ndarray:
+        """Approximate tokens per text (Ollama has no tokenize endpoint)"""
+        return np.array([len(t) // 4 + 2 for t in texts], dtype=np.int64)
+    
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        out = None
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            try:
+                with ollama_endpoint(self.model) as base_url:
+                    response = get_session().post(
+                        f"{base_url}/api/embed",
+                        json={
+                            "model": self.model,
+                            "input": batch,
+                            "truncate": True,
+                            "keep_alive": get_residency().keep_alive(self.model),
+                        },
+                        timeout=(5, 120)
+                    )
+                    response.raise_for_status()
+                    embeddings = response.json()["embeddings"]
+            except requests.RequestException as e:
+                raise RuntimeError(f"Ollama connection failed: {str(e)}")
+            except (KeyError, ValueError) as e:
+                raise RuntimeError(f"Ollama embedding failed: {str(e)}")
+            if len(embeddings) != len(batch):
+                raise RuntimeError(f"Ollama returned {len(embeddings)} embeddings for {len(batch)} texts")
+            if out is None:
+                out = np.empty((len(texts), len(embeddings[0])), dtype=np.float32)
+            out[start:start + len(batch)] = embeddings
+        return out if out is not None else np.empty((0, 0), dtype=np.float32)
+
+
+class TransformersTokenizer:
+    """Tokenizer of a sentence-transformers model, loaded without its weights"""
+    
+    def __init__(self, model_id: str):
+        from transformers import AutoTokenizer
+        
+        # Bare names resolve like SentenceTransformer resolves them
+        if "/" not in model_id and not os.path.isdir(model_id):
+            model_id = f"sentence-transformers/{model_id}"
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id)
+        self.max_seq_length = _max_seq_length(model_id) or min(self.tokenizer.model_max_length, 512)
+    
+    def token_lengths(self, texts: List[str]) -> np.ndarray:
+        input_ids = self.tokenizer(
+            texts, add_special_tokens=True, truncation=True, max_length=self.max_seq_length
+        )["input_ids"]
+        return np.fromiter(map(len, input_ids), dtype=np.int64, count=len(texts))
+
+
+def _max_seq_length(model_id: str) -> int | None:
+    """``max_seq_length`` from the model's sentence_bert_config.json, if it has one"""
+    path = os.path.join(model_id, "sentence_bert_config.json")
+    try:
+        if not os.path.isfile(path):
+            from huggingface_hub import hf_hub_download
+            path = hf_hub_download(model_id, "sentence_bert_config.json")
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get("max_seq_length")
+    except (ImportError, OSError, ValueError):
+        return None
+
+
+def _backend_model(model: str) -> str:
+    """Model spec after applying ``RAG_EMBED_BACKEND`` to names without a backend prefix
+    
+    With ``RAG_EMBED_BACKEND=ollama``, ``all-MiniLM-L6-v2`` becomes
+    ``ollama:all-minilm`` (other names are passed to Ollama unchanged).
+    """
+    if os.getenv("RAG_EMBED_BACKEND", "").lower() != "ollama" or model.startswith(("ollama:", "onnx:", "onnx-int8:")):
+        return model
+    return f"ollama:{_OLLAMA_ALIASES.get(model, model)}"
+
 
 @lru_cache(maxsize=1)
 def _get_embedder(model_id: str):
-    """Load and optimize embedding model (cached)"""
+    """Load and optimize embedding model (cached)
+    
+    ``onnx:<model>`` and ``onnx-int8:<model>`` select the ONNX Runtime
+    backend (``rag.onnx_embedder``), which avoids importing torch;
+    ``ollama:<model>`` embeds through the Ollama server.
+    """
+    if model_id.startswith("ollama:"):
+        return OllamaEmbedder(model_id[len("ollama:"):])
+    
+    from rag.onnx_embedder import load_onnx_embedder, parse_model
+    if parse_model(model_id):
+        return load_onnx_embedder(model_id)
+    
     from sentence_transformers import SentenceTransformer
     
     model = SentenceTransformer(model_id, device='cpu')
@@ -22,45 +136,176 @@ def _get_embedder(model_id: str):
     return model
 
 
-def embed_texts(texts: List[str], *, model: str = "sentence-transformers/all-MiniLM-L6-v2") -> List[List[float]]:
-    """Generate embeddings with optimized speed"""
-    if not texts:
-        return []
+@lru_cache(maxsize=4)
+def _get_tokenizer(model_id: str):
+    """Token counter for a model that does not load the model itself (cached)
+    
+    Falls back to the embedder when the tokenizer cannot be loaded on its
+    own (an ONNX model that is not exported yet, a custom model).
+    """
+    if model_id.startswith("ollama:"):
+        return OllamaEmbedder(model_id[len("ollama:"):])
+    
+    from rag.onnx_embedder import load_onnx_tokenizer, parse_model
+    if parse_model(model_id):
+        return load_onnx_tokenizer(model_id) or _get_embedder(model_id)
     
+    try:
+        return TransformersTokenizer(model_id)
+    except (ImportError, OSError, ValueError):
+        return _get_embedder(model_id)
+
+
+def _encode(
+    texts: List[str], model: str, out: np.ndarray | None = None, batch_size: int | None = None
+) -> np.ndarray:
+    """Run the embedding model and L2-normalize the result (into ``out`` if given)"""
     embedder = _get_embedder(model)
     
     # Fast encoding with numpy normalization
     vectors = embedder.encode(
         texts,
+        batch_size=batch_size or 32,
         show_progress_bar=False,
         convert_to_numpy=True,
         normalize_embeddings=False  # Do manual normalization
     )
     
-    # Manual L2 normalization (faster than model's)
+    # Manual L2 normalization (faster than model's), written in place
     norms = np.linalg.norm(vectors, axis=1, keepdims=True)
-    vectors = vectors / (norms + 1e-8)  # Avoid division by zero
+    norms += 1e-8  # Avoid division by zero
+    if out is None:
+        out = vectors.astype(np.float32, copy=False)
+    return np.divide(vectors, norms, out=out)
+
+
+def embed_array(
+    texts: List[str],
+    *,
+    model: str = "sentence-transformers/all-MiniLM-L6-v2",
+    out: np.ndarray | None = None,
+    batch_size: int | None = None,
+    persist: bool = True,
+    storage_dir: str | os.PathLike | None = None
+) -> np.ndarray:
+    """Embed texts into a contiguous (n, dim) float32 array of unit vectors
+    
+    Pass a C-contiguous float32 ``out`` array (e.g. a slice of a reusable
+    batch buffer) to have the vectors written into it without extra copies.
+    Vectors are served from the persistent embedding cache of ``storage_dir``
+    when possible; the model only runs (and is only loaded) for cache misses.
+    ``batch_size`` is the model's forward-pass size (default 32); pass
+    ``len(texts)`` for pre-formed batches. ``persist=False`` is for
+    query-time texts: they use the small in-process cache instead.
+    """
+    if out is not None and (
+        out.dtype != np.float32 or not out.flags.c_contiguous or out.shape[0] != len(texts)
+    ):
+        raise ValueError("out must be a C-contiguous float32 array with one row per text")
+    if not texts:
+        return out if out is not None else np.empty((0, 0), dtype=np.float32)
+    model = _backend_model(model)
+    
+    from rag.embed_cache import get_embedding_cache, get_query_embedding_cache
+    cache = get_embedding_cache(storage_dir) if persist else get_query_embedding_cache()
+    if cache is None:
+        return _encode(texts, model, out, batch_size)
+    
+    vectors, missing = cache.get_many(model, texts, out)
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        if len(missing) == len(texts):
+            vectors = computed = _encode(missing_texts, model, vectors, batch_size)
+        else:
+            computed = _encode(missing_texts, model, batch_size=batch_size)
+            if vectors is None:
+                vectors = np.empty((len(texts), computed.shape[1]), dtype=np.float32)
+            vectors[missing] = computed
+        cache.put_many(model, missing_texts, computed)
     
-    return vectors.tolist()
+    return vectors
 
 
-def chat_answer(
-    *, 
-    question: str, 
-    context: str, 
-    model: str = "llama3.2:1b", 
-    max_tokens: int = 120
-) -> str:
-    """Generate answer using Ollama with optimized settings"""
-    ollama_url = os.getenv("OLLAMA_URL", "http://127.0.0.1:11434")
+def token_lengths(texts: List[str], *, model: str = "sentence-transformers/all-MiniLM-L6-v2") -> np.ndarray:
+    """Tokens per text as the embedding model sees them (special tokens included, truncated)
     
-    # Concise prompt for faster generation
-    prompt = f"Based on this context, answer briefly:\n\nContext: {context[:1200]}...\n\nQ: {question}\nA:"
+    Only the tokenizer is loaded, not the model. Falls back to ~4 characters
+    per token when the model has no tokenizer.
+    """
+    counter = _get_tokenizer(_backend_model(model))
+    if hasattr(counter, "token_lengths"):
+        return counter.token_lengths(texts)
+    tokenizer = getattr(counter, "tokenizer", None)
+    if tokenizer is None:
+        return np.array([len(t) // 4 + 2 for t in texts], dtype=np.int64)
+    
+    limit = getattr(counter, "max_seq_length", None) or 512
+    input_ids = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=limit)["input_ids"]
+    return np.fromiter(map(len, input_ids), dtype=np.int64, count=len(texts))
+
+
+_BATCHERS = {}
+_BATCHERS_LOCK = threading.Lock()
+
+
+def _query_batcher(model: str):
+    """Per-model micro-batcher shared by all query-embedding callers"""
+    from rag.batching import MicroBatcher
+    with _BATCHERS_LOCK:
+        if model not in _BATCHERS:
+            _BATCHERS[model] = MicroBatcher(
+                lambda texts: embed_array(texts, model=model, persist=False),
+                max_batch=int(os.getenv("RAG_QUERY_BATCH_SIZE", "32")),
+                max_wait_ms=float(os.getenv("RAG_QUERY_BATCH_WAIT_MS", "2"))
+            )
+        return _BATCHERS[model]
+
+
+def embed_query(text: str, *, model: str = "sentence-transformers/all-MiniLM-L6-v2") -> np.ndarray:
+    """Embed a single query as a (dim,) unit vector
+    
+    Concurrent callers are coalesced into shared forward passes by a
+    micro-batcher (``RAG_QUERY_BATCH_WAIT_MS`` bounds the added latency,
+    ``RAG_QUERY_BATCH_SIZE`` the batch). Set ``RAG_QUERY_BATCHING=0`` to
+    embed each query on the calling thread instead.
+    """
+    if os.getenv("RAG_QUERY_BATCHING", "1").lower() in {"0", "false", "off"}:
+        return embed_array([text], model=model, persist=False)[0]
+    return _query_batcher(model).embed(text)
+
+
+def query_batch_stats() -> dict:
+    """Batch-size and queue-delay metrics of the query micro-batchers, per model"""
+    with _BATCHERS_LOCK:
+        batchers = dict(_BATCHERS)
+    return {model: batcher.stats() for model, batcher in batchers.items()}
+
+
+def embed_texts(texts: List[str], *, model: str = "sentence-transformers/all-MiniLM-L6-v2") -> List[List[float]]:
+    """Generate embeddings as nested lists (prefer ``embed_array`` for numeric work)
     
-    payload = {
+    Backends follow ``model``: a sentence-transformers id runs in-process,
+    ``onnx:``/``onnx-int8:`` on ONNX Runtime and ``ollama:<name>`` on the
+    Ollama server (``RAG_EMBED_BACKEND=ollama`` applies to bare names).
+    """
+    if not texts:
+        return []
+    return embed_array(texts, model=model).tolist()
+
+
+def build_prompt(question: str, context: str) -> str:
+    """Generation prompt; ``context`` is expected to be packed to its budget already"""
+    # Concise prompt for faster generation
+    return f"Based on this context, answer briefly:\n\nContext: {context}\n\nQ: {question}\nA:"
+
+
+def _generate_payload(*, question: str, context: str, model: str, max_tokens: int, stream: bool) -> dict:
+    """Ollama /api/generate request body"""
+    return {
         "model": model,
-        "prompt": prompt,
-        "stream": False,
+        "prompt": build_prompt(question, context),
+        "stream": stream,
+        "keep_alive": get_residency().keep_alive(model),
         "options": {
             "temperature": 0.1,
             "num_predict": max_tokens,
@@ -70,17 +315,174 @@ def chat_answer(
             "num_thread": 4  # Optimize for multi-core
         }
     }
+
+
+def _record_generation(stats: dict | None, payload: dict, message: dict) -> None:
+    """Copy Ollama's final token counts and timings into ``stats``; calibrate token counting"""
+    from rag.context import observe_prompt
     
-    try:
-        response = requests.post(
-            f"{ollama_url.rstrip('/')}/api/generate",
-            json=payload,
-            timeout=45  # Reduced timeout
-        )
-        response.raise_for_status()
-        return response.json().get("response", "").strip()
-    
-    except requests.RequestException as e:
-        raise RuntimeError(f"Ollama connection failed: {str(e)}")
-    except Exception as e:
-        raise RuntimeError(f"Chat generation failed: {str(e)}")
+    observe_prompt(payload["model"], payload["prompt"], message.get("prompt_eval_count", 0))
+    if stats is not None:
+        stats.update({
+            "prompt_eval_count": message.get("prompt_eval_count"),
+            "eval_count": message.get("eval_count"),
+            "prefill_ms": round(message.get("prompt_eval_duration", 0) / 1e6, 1),
+            "generate_ms": round(message.get("eval_duration", 0) / 1e6, 1),
+        })
+
+
+def chat_answer(
+    *, 
+    question: str, 
+    context: str, 
+    model: str = "llama3.2:1b", 
+    max_tokens: int = 120,
+    stats: dict | None = None
+) -> str:
+    """Generate answer using Ollama with optimized settings
+    
+    ``stats``, if given, receives Ollama's prompt/completion token counts
+    and prefill/generation times. The request waits for a slot of the
+    backend scheduler first (``rag.scheduler``; ``queue_ms`` in ``stats``)
+    and raises ``BackendBusy`` when none is available in time.
+    """
+    payload = _generate_payload(
+        question=question, context=context, model=model, max_tokens=max_tokens, stream=False
+    )
+    
+    with backend_slot(stats), ollama_endpoint(model) as base_url:
+        try:
+            response = get_session().post(
+                f"{base_url}/api/generate",
+                json=payload,
+                timeout=45  # Reduced timeout
+            )
+            response.raise_for_status()
+            message = response.json()
+            _record_generation(stats, payload, message)
+            return message.get("response", "").strip()
+    
+        except requests.RequestException as e:
+            raise RuntimeError(f"Ollama connection failed: {str(e)}")
+        except Exception as e:
+            raise RuntimeError(f"Chat generation failed: {str(e)}")
+
+
+def chat_answer_stream(
+    *,
+    question: str,
+    context: str,
+    model: str = "llama3.2:1b",
+    max_tokens: int = 120,
+    stats: dict | None = None
+) -> Iterator[str]:
+    """Yield answer tokens from Ollama's NDJSON stream as they are generated"""
+    payload = _generate_payload(
+        question=question, context=context, model=model, max_tokens=max_tokens, stream=True
+    )
+    
+    with backend_slot(stats), ollama_endpoint(model) as base_url:
+        try:
+            with get_session().post(
+                f"{base_url}/api/generate",
+                json=payload,
+                stream=True,
+                timeout=(5, 45)  # Connect, then max gap between tokens
+            ) as response:
+                response.raise_for_status()
+                started = False
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    message = json.loads(line)
+                    if message.get("error"):
+                        raise RuntimeError(message["error"])
+                    if message.get("done"):
+                        _record_generation(stats, payload, message)
+                    token = message.get("response", "")
+                    if not started:
+                        token = token.lstrip()  # Match chat_answer's stripped output
+                        started = bool(token)
+                    if token:
+                        yield token
+    
+        except requests.RequestException as e:
+            raise RuntimeError(f"Ollama connection failed: {str(e)}")
+        except RuntimeError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Chat generation failed: {str(e)}")
+
+
+async def chat_answer_async(
+    *,
+    question: str,
+    context: str,
+    model: str = "llama3.2:1b",
+    max_tokens: int = 120,
+    stats: dict | None = None
+) -> str:
+    """Non-blocking ``chat_answer`` over the shared async HTTP pool"""
+    import httpx
+    
+    payload = _generate_payload(
+        question=question, context=context, model=model, max_tokens=max_tokens, stream=False
+    )
+    
+    async with backend_slot_async(stats), ollama_endpoint_async(model) as base_url:
+        try:
+            response = await get_async_client().post(f"{base_url}/api/generate", json=payload)
+            response.raise_for_status()
+            message = response.json()
+            _record_generation(stats, payload, message)
+            return message.get("response", "").strip()
+    
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"Ollama connection failed: {str(e)}")
+        except Exception as e:
+            raise RuntimeError(f"Chat generation failed: {str(e)}")
+
+
+async def chat_answer_stream_async(
+    *,
+    question: str,
+    context: str,
+    model: str = "llama3.2:1b",
+    max_tokens: int = 120,
+    stats: dict | None = None
+) -> AsyncIterator[str]:
+    """Non-blocking ``chat_answer_stream``: async iterator of answer tokens"""
+    import httpx
+    
+    payload = _generate_payload(
+        question=question, context=context, model=model, max_tokens=max_tokens, stream=True
+    )
+    
+    async with backend_slot_async(stats), ollama_endpoint_async(model) as base_url:
+        try:
+            async with get_async_client().stream(
+                "POST", f"{base_url}/api/generate", json=payload
+            ) as response:
+                response.raise_for_status()
+                started = False
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    message = json.loads(line)
+                    if message.get("error"):
+                        raise RuntimeError(message["error"])
+                    if message.get("done"):
+                        _record_generation(stats, payload, message)
+                    token = message.get("response", "")
+                    if not started:
+                        token = token.lstrip()  # Match chat_answer's stripped output
+                        started = bool(token)
+                    if token:
+                        yield token
+    
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"Ollama connection failed: {str(e)}")
+        except RuntimeError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Chat generation failed: {str(e)}")
@@ -0,0 +1,76 @@
+"""Read-only flat index over a memory-mapped float32 vector file
+
+``vectors.npy`` holds the unit vectors of a flat index as a plain (n, dim)
+float32 array whose rows line up with ``chunks.bin``. Mapping it instead of
+reading ``faiss.index`` lets every process on a host share the same
+page-cache pages, and opening it costs the same at any corpus size.
+"""
+import os
+from pathlib import Path
+import numpy as np
+
+
+class MappedFlatIndex:
+    """Exact inner-product search with the subset of the FAISS index API used by retrieval"""
+
+    block_rows = 65536  # Rows scored per step, bounding temporaries for large corpora
+
+    def __init__(self, vectors_path: str | os.PathLike, ids: np.ndarray):
+        self.path = Path(vectors_path)
+        self.vectors = np.load(self.path, mmap_mode="r")
+        if self.vectors.dtype != np.float32 or self.vectors.ndim != 2 or len(self.vectors) != len(ids):
+            raise RuntimeError(f"Vector file does not match chunk store: {self.path}")
+        self.ids = ids
+        self.ntotal, self.d = self.vectors.shape
+
+    def search(self, queries: np.ndarray, k: int, params=None):
+        """Top-``k`` (scores, ids) per query row, shaped like ``faiss.Index.search``"""
+        queries = np.asarray(queries, dtype=np.float32)
+        k = min(k, self.ntotal)
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+
+        for start in range(0, self.ntotal, self.block_rows):
+            block = self.vectors[start:start + self.block_rows]
+            scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+            rows = np.concatenate(
+                [best_rows, np.broadcast_to(np.arange(start, start + len(block)), (len(queries), len(block)))],
+                axis=1
+            )
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_rows = np.take_along_axis(rows, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        labels = np.where(best_rows >= 0, self.ids[np.maximum(best_rows, 0)], -1)
+        return best_scores, labels
+
+
+def write_vectors(
+    path: str | os.PathLike,
+    vectors: np.ndarray,
+    order: np.ndarray | None = None,
+    *,
+    block_rows: int = 65536
+) -> None:
+    """Save vectors as ``.npy`` via a temp file so readers never see a partial file
+    
+    Rows (taken in ``order`` when given) are copied a block at a time into
+    the mapped output file, so ``vectors`` can be a view of an index's own
+    storage and is never copied whole.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    if not len(vectors):
+        with tmp_path.open("wb") as f:
+            np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+    else:
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=vectors.shape)
+        for start in range(0, len(out), block_rows):
+            rows = slice(start, start + block_rows) if order is None else order[start:start + block_rows]
+            out[start:start + block_rows] = vectors[rows]
+        out.flush()
+        del out  # Unmap before the rename (required on Windows)
+    os.replace(tmp_path, path)
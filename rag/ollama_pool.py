@@ -0,0 +1,217 @@
+"""Load-balanced routing across several Ollama servers
+
+``OLLAMA_URLS`` (comma-separated) lists the endpoints; without it every
+request goes to the single ``OLLAMA_URL``. Each request is routed to the
+healthy endpoint with the lowest expected cost, which is (in-flight
+requests + 1) x recent latency (an EWMA). A penalty is added when the
+requested model is not resident there, so warm servers are preferred
+unless they are much busier.
+
+A background thread polls ``/api/ps`` on every endpoint every
+``RAG_OLLAMA_HEALTH_INTERVAL`` seconds (10, ``0`` turns polling off). The
+poll refreshes the resident-model lists and re-admits recovered
+endpoints. An endpoint is ejected after a failed poll or ``eject_after``
+consecutive failed requests (connection errors, timeouts, 5xx). When every
+endpoint is ejected, requests still go to the least-bad one rather than
+failing outright. ``benchmarks/ollama_pool_check.py`` exercises this
+against stand-in servers.
+"""
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Iterator, List
+
+from rag.http_clients import get_session, ollama_url
+
+
+class Endpoint:
+    """Routing state of one Ollama server"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.inflight = 0
+        self.latency_ms = 0.0  # EWMA of request durations (0 until measured)
+        self.healthy = True
+        self.failures = 0      # Consecutive failed requests
+        self.resident = set()  # Models loaded in memory, from /api/ps
+        self.requests = 0
+        self.errors = 0
+
+    def cost(self, model: str | None, cold_penalty_ms: float, prior_ms: float) -> float:
+        cost = (self.inflight + 1) * max(self.latency_ms or prior_ms, 1.0)
+        if model and _tagged(model) not in self.resident:
+            cost += cold_penalty_ms
+        return cost
+
+
+def _tagged(model: str) -> str:
+    """Model name as /api/ps reports it (``:latest`` when no tag is given)"""
+    return model if ":" in model else f"{model}:latest"
+
+
+def ollama_urls() -> List[str]:
+    """Configured Ollama endpoints (``OLLAMA_URLS``, else ``OLLAMA_URL``)"""
+    urls = [url.strip().rstrip("/") for url in os.getenv("OLLAMA_URLS", "").split(",") if url.strip()]
+    return urls or [ollama_url()]
+
+
+def _is_node_failure(error: BaseException) -> bool:
+    """Connection-level error or 5xx anywhere in the exception chain (not e.g. a missing model)"""
+    import requests
+    try:
+        import httpx
+        transport_errors = (requests.ConnectionError, requests.Timeout, httpx.TransportError)
+    except ImportError:
+        transport_errors = (requests.ConnectionError, requests.Timeout)
+
+    while error is not None:
+        if isinstance(error, transport_errors):
+            return True
+        response = getattr(error, "response", None)
+        if response is not None and getattr(response, "status_code", 0) >= 500:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class OllamaPool:
+    """Least-loaded, model-aware endpoint selection with background health checks"""
+
+    def __init__(
+        self,
+        urls: List[str],
+        *,
+        health_interval: float = 10.0,
+        eject_after: int = 2,
+        cold_penalty_ms: float = 3000.0,
+        alpha: float = 0.3
+    ):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.health_interval = health_interval
+        self.eject_after = eject_after
+        self.cold_penalty_ms = cold_penalty_ms
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._checker_pid = None
+        self._wake = threading.Event()
+
+    def _ensure_checker(self) -> None:
+        """(Re)start the health-check thread, e.g. in a freshly forked worker"""
+        if self._checker_pid != os.getpid() and self.health_interval > 0:
+            self._checker_pid = os.getpid()
+            threading.Thread(target=self._check_loop, name="ollama-health", daemon=True).start()
+
+    def _check_loop(self) -> None:
+        while True:
+            self.check_all()
+            self._wake.wait(self.health_interval)
+            self._wake.clear()
+
+    def check(self, endpoint: Endpoint) -> bool:
+        """Poll ``/api/ps``: refresh resident models, eject or re-admit the endpoint"""
+        try:
+            response = get_session().get(f"{endpoint.url}/api/ps", timeout=2)
+            response.raise_for_status()
+            resident = {_tagged(m.get("name") or m.get("model")) for m in response.json().get("models", [])}
+        except Exception:
+            with self._lock:
+                endpoint.healthy = False
+            return False
+        with self._lock:
+            endpoint.resident = resident
+            endpoint.healthy = True
+            endpoint.failures = 0
+        return True
+
+    def check_all(self) -> None:
+        for endpoint in self.endpoints:
+            self.check(endpoint)
+
+    def pick(self, model: str | None = None) -> Endpoint:
+        """Cheapest healthy endpoint for ``model`` (counted as in flight until ``done``)"""
+        self._ensure_checker()
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.healthy] or self.endpoints
+            measured = [e.latency_ms for e in self.endpoints if e.latency_ms]
+            prior = sum(measured) / len(measured) if measured else 1.0  # For endpoints not yet measured
+            endpoint = min(candidates, key=lambda e: e.cost(model, self.cold_penalty_ms, prior))
+            endpoint.inflight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def done(self, endpoint: Endpoint, elapsed: float, *, model: str | None = None, error: BaseException | None = None) -> None:
+        """Record the outcome of a request routed to ``endpoint``"""
+        with self._lock:
+            endpoint.inflight -= 1
+            if error is not None and _is_node_failure(error):
+                endpoint.errors += 1
+                endpoint.failures += 1
+                if endpoint.failures >= self.eject_after and endpoint.healthy:
+                    endpoint.healthy = False
+                    self._wake.set()  # Probe it again soon
+                return
+            endpoint.failures = 0
+            if error is None:
+                ms = elapsed * 1000
+                endpoint.latency_ms = ms if not endpoint.latency_ms else (1 - self.alpha) * endpoint.latency_ms + self.alpha * ms
+                if model:
+                    endpoint.resident.add(_tagged(model))  # Ollama keeps it loaded after serving it
+
+    @contextmanager
+    def lease(self, model: str | None = None) -> Iterator[str]:
+        """Base URL to send one request to; load and outcome are tracked around the block"""
+        endpoint = self.pick(model)
+        started = time.perf_counter()
+        try:
+            yield endpoint.url
+        except BaseException as e:
+            self.done(endpoint, time.perf_counter() - started, model=model, error=e)
+            raise
+        self.done(endpoint, time.perf_counter() - started, model=model)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "endpoints": [
+                    {
+                        "url": e.url,
+                        "healthy": e.healthy,
+                        "inflight": e.inflight,
+                        "latency_ms": round(e.latency_ms, 1),
+                        "requests": e.requests,
+                        "errors": e.errors,
+                        "resident": sorted(e.resident),
+                    }
+                    for e in self.endpoints
+                ],
+                "healthy": sum(e.healthy for e in self.endpoints),
+            }
+
+
+@lru_cache(maxsize=1)
+def get_pool() -> OllamaPool | None:
+    """Process-wide pool over ``OLLAMA_URLS`` (None for a single endpoint)"""
+    urls = ollama_urls()
+    if len(urls) < 2:
+        return None
+    return OllamaPool(urls, health_interval=float(os.getenv("RAG_OLLAMA_HEALTH_INTERVAL", "10")))
+
+
+@contextmanager
+def ollama_endpoint(model: str | None = None) -> Iterator[str]:
+    """Base URL for one Ollama request, routed through the pool when configured"""
+    pool = get_pool()
+    if pool is None:
+        yield ollama_urls()[0]
+        return
+    with pool.lease(model) as url:
+        yield url
+
+
+@asynccontextmanager
+async def ollama_endpoint_async(model: str | None = None) -> AsyncIterator[str]:
+    """``ollama_endpoint`` for ``async with`` (selection itself never blocks)"""
+    with ollama_endpoint(model) as url:
+        yield url
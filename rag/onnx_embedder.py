@@ -0,0 +1,235 @@
+"""ONNX Runtime embedding backend (no torch at query time)
+
+Select it per ``embedding_model`` with a prefix:
+
+    onnx:sentence-transformers/all-MiniLM-L6-v2        float32 graph
+    onnx-int8:sentence-transformers/all-MiniLM-L6-v2   dynamically int8-quantized weights
+
+The backend is optional: install it with
+``pip install -r requirements-onnx.txt`` (onnxruntime, and onnx for the
+export). The model is exported once (this step still needs torch and
+sentence-transformers) into ``RAG_ONNX_DIR`` (default ``storage/onnx``),
+either on first use or ahead of time with
+``python -m rag.onnx_embedder <model_id>``. After that, only onnxruntime
+and the ``tokenizers`` package are loaded.
+
+Vectors use the same mean pooling as the sentence-transformers model, so
+they can query existing indexes. Export checks them against the torch model
+and stores the worst cosine similarity in ``onnx_config.json``. The checks
+require at least ``1 - TOLERANCE[variant]``: 0.9999 for float32 and 0.98 for
+int8. An export outside tolerance raises, and a variant recorded as outside
+it is never loaded. Set ``RAG_ONNX_THREADS`` to cap ONNX Runtime's intra-op
+threads.
+"""
+import inspect
+import json
+import logging
+import os
+import sys
+from functools import lru_cache
+from pathlib import Path
+from typing import List
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+PREFIXES = {"onnx:": "fp32", "onnx-int8:": "int8"}
+TOLERANCE = {"fp32": 1e-4, "int8": 0.02}  # Max 1 - cosine vs. the torch model
+_FILES = {"fp32": "model.onnx", "int8": "model.int8.onnx"}
+_CHECK_TEXTS = [
+    "Amdahl's law bounds the speedup of a program by its serial fraction.",
+    "FAISS searches dense vectors with inner-product indexes.",
+    "short",
+    "The quick brown fox jumps over the lazy dog. " * 20,
+]
+
+
+def parse_model(model: str) -> tuple[str, str] | None:
+    """(base model id, variant) for an ``onnx:``/``onnx-int8:`` spec, else None"""
+    for prefix, variant in PREFIXES.items():
+        if model.startswith(prefix):
+            return model[len(prefix):], variant
+    return None
+
+
+def model_dir(model_id: str) -> Path:
+    return Path(os.getenv("RAG_ONNX_DIR", "storage/onnx")) / model_id.replace("/", "__")
+
+
+def export_onnx(model_id: str, out_dir: str | os.PathLike | None = None, *, quantize: bool = True) -> Path:
+    """Export a sentence-transformers model to ONNX (plus an int8 copy) and verify it
+
+    Raises ``RuntimeError`` when a variant disagrees with the torch model by
+    more than ``TOLERANCE``; the failing result stays recorded in
+    ``onnx_config.json`` so it is not served.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out_dir = Path(out_dir or model_dir(model_id))
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    st_model = SentenceTransformer(model_id, device="cpu")
+    pooling = st_model[1].get_config_dict() if len(st_model) > 1 else {}
+    if not pooling.get("pooling_mode_mean_tokens"):
+        raise ValueError(f"Only mean-pooling models can be exported: {model_id}")
+    transformer = st_model[0].auto_model.eval()
+    st_model.tokenizer.save_pretrained(out_dir)  # Writes tokenizer.json for the fast tokenizer
+
+    sample = st_model.tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    # The TorchScript exporter: newer torch defaults to dynamo, which needs onnxscript
+    legacy = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (sample["input_ids"], {name: sample[name] for name in input_names[1:]}),
+            str(out_dir / _FILES["fp32"]),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic,
+            opset_version=14,
+            **legacy,
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(str(out_dir / _FILES["fp32"]), str(out_dir / _FILES["int8"]), weight_type=QuantType.QInt8)
+
+    config_path = out_dir / "onnx_config.json"
+    checked = json.loads(config_path.read_text(encoding="utf-8")).get("min_cosine", {}) if config_path.exists() else {}
+    checked.pop("fp32", None)  # The float32 graph was just rewritten
+    if quantize:
+        checked.pop("int8", None)
+    config = {
+        "model_id": model_id,
+        "max_seq_length": st_model.max_seq_length,
+        "dim": st_model.get_sentence_embedding_dimension(),
+        "inputs": input_names,
+        "min_cosine": checked,  # Earlier int8 result still holds when only fp32 was re-exported
+    }
+    config_path.write_text(json.dumps(config, indent=2), encoding="utf-8")
+
+    # Check agreement with the torch model on a few texts
+    reference = st_model.encode(_CHECK_TEXTS, normalize_embeddings=True, convert_to_numpy=True)
+    failed = []
+    for variant in (("fp32", "int8") if quantize else ("fp32",)):
+        vectors = OnnxEmbedder(out_dir, variant).encode(_CHECK_TEXTS)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        cosine = float((vectors * reference).sum(axis=1).min())
+        config["min_cosine"][variant] = round(cosine, 6)
+        if 1 - cosine > TOLERANCE[variant]:
+            failed.append(f"{variant} (cosine {cosine:.4f})")
+    config_path.write_text(json.dumps(config, indent=2), encoding="utf-8")
+    if failed:
+        raise RuntimeError(f"ONNX export of {model_id} is outside tolerance: {', '.join(failed)}")
+    return out_dir
+
+
+class OnnxTokenizer:
+    """Tokenizer of an exported model, usable without an inference session"""
+
+    def __init__(self, path: str | os.PathLike):
+        from tokenizers import Tokenizer
+
+        path = Path(path)
+        config = json.loads((path / "onnx_config.json").read_text(encoding="utf-8"))
+        self.max_seq_length = config["max_seq_length"]
+        self._inputs = config["inputs"]
+
+        self._tokenizer = Tokenizer.from_file(str(path / "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self._tokenizer.no_padding()  # Padded per batch in encode()
+
+    def token_lengths(self, texts: List[str]) -> np.ndarray:
+        """Tokens per text, special tokens included, after truncation"""
+        encodings = self._tokenizer.encode_batch(texts)
+        return np.fromiter((len(e.ids) for e in encodings), dtype=np.int64, count=len(texts))
+
+
+class OnnxEmbedder(OnnxTokenizer):
+    """Mean-pooled sentence embeddings from an exported ONNX graph
+
+    Mirrors the subset of ``SentenceTransformer`` used by ``rag.llm_client``:
+    ``encode`` returns unnormalized (n, dim) float32 vectors.
+    """
+
+    def __init__(self, path: str | os.PathLike, variant: str = "fp32"):
+        import onnxruntime as ort
+
+        super().__init__(path)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if os.getenv("RAG_ONNX_THREADS"):
+            options.intra_op_num_threads = int(os.environ["RAG_ONNX_THREADS"])
+        self._session = ort.InferenceSession(
+            str(Path(path) / _FILES[variant]), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(texts)
+        out = None
+        # Length-sorted batches keep padding short
+        order = np.argsort([len(e.ids) for e in encodings], kind="stable")
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            width = max(len(encodings[i].ids) for i in rows)
+            feeds = {name: np.zeros((len(rows), width), dtype=np.int64) for name in self._inputs}
+            for r, i in enumerate(rows):
+                e = encodings[i]
+                n = len(e.ids)
+                feeds["input_ids"][r, :n] = e.ids
+                feeds["attention_mask"][r, :n] = e.attention_mask
+                if "token_type_ids" in feeds:
+                    feeds["token_type_ids"][r, :n] = e.type_ids
+
+            hidden = self._session.run(["last_hidden_state"], feeds)[0]
+            mask = feeds["attention_mask"][:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if out is None:
+                out = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+            out[rows] = pooled
+        return out if out is not None else np.empty((0, 0), dtype=np.float32)
+
+
+@lru_cache(maxsize=4)
+def load_onnx_embedder(model: str) -> OnnxEmbedder:
+    """Embedder for an ``onnx:``/``onnx-int8:`` spec, exporting the model on first use"""
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(f"{model} needs the optional ONNX backend: pip install -r requirements-onnx.txt") from e
+    model_id, variant = parse_model(model)
+    path = model_dir(model_id)
+    config_path = path / "onnx_config.json"
+    cosine = None
+    if (path / _FILES[variant]).exists() and config_path.exists():
+        cosine = json.loads(config_path.read_text(encoding="utf-8"))["min_cosine"].get(variant)
+    if cosine is None:  # Missing or never verified
+        logger.info("Exporting %s to ONNX (one-time)", model_id)
+        export_onnx(model_id, path, quantize=variant == "int8")
+    elif 1 - cosine > TOLERANCE[variant]:
+        raise RuntimeError(
+            f"ONNX {variant} export of {model_id} is outside tolerance (cosine {cosine:.4f}); "
+            f"use another variant or re-export with: python -m rag.onnx_embedder {model_id}"
+        )
+    return OnnxEmbedder(path, variant)
+
+
+def load_onnx_tokenizer(model: str) -> OnnxTokenizer | None:
+    """Tokenizer for an ``onnx:``/``onnx-int8:`` spec, or None until the model is exported"""
+    model_id, _ = parse_model(model)
+    path = model_dir(model_id)
+    if not (path / "tokenizer.json").exists() or not (path / "onnx_config.json").exists():
+        return None
+    return OnnxTokenizer(path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for name in sys.argv[1:] or ["sentence-transformers/all-MiniLM-L6-v2"]:
+        target = export_onnx(name)
+        cosine = json.loads((target / "onnx_config.json").read_text(encoding="utf-8"))["min_cosine"]
+        logger.info("Exported %s -> %s: %s", name, target, cosine)
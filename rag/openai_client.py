@@ -5,13 +5,17 @@ from typing import List
 
 from openai import OpenAI
 
+from rag.http_clients import get_openai_client
+
 
 def _client() -> OpenAI:
     # The OpenAI SDK reads OPENAI_API_KEY from env automatically,
     # but we fail early with a clearer message.
-    if not os.getenv("OPENAI_API_KEY"):
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
         raise RuntimeError("OPENAI_API_KEY not set. Set it in PowerShell or Streamlit secrets.")
-    return OpenAI()
+    # Shared client: connections are pooled across calls
+    return get_openai_client(api_key)
 
 
 def embed_texts(texts: List[str], *, model: str = "text-embedding-3-small") -> List[List[float]]:
@@ -1,50 +1,141 @@
 """Optimized RAG core with smart caching and fast retrieval"""
+import asyncio
 import json
 import os
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
-from typing import List, Tuple
+from typing import AsyncIterator, Iterator, List, Tuple
 import numpy as np
 import faiss
 
+from rag.chunk_store import ChunkStore
+from rag.mapped_index import MappedFlatIndex
+from rag.singleflight import AsyncSingleFlight, SingleFlight
+
 
 @dataclass(frozen=True)
 class RetrievedChunk:
     text: str
     source: str
     score: float
+    chunk_id: int = -1  # Vector ID; consecutive IDs are neighbours in the same document
 
 
 # Global index cache to avoid reloading
 _INDEX_CACHE = {}
+# In-flight answers by key, so identical concurrent questions share one generation
+_FLIGHTS = SingleFlight()
+_ASYNC_FLIGHTS = weakref.WeakKeyDictionary()
+
+
+def _mmap_enabled() -> bool:
+    return os.getenv("RAG_INDEX_MMAP", "1").lower() not in {"0", "false", "off"}
+
+
+def _manifest_stamp(storage_path: Path) -> Tuple[int, int] | None:
+    """Identity of the ingest manifest; None while an ingest is replacing the files"""
+    try:
+        stat = (storage_path / "manifest.json").stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
 
 
-def _load_index_cached(storage_dir: str):
-    """Load FAISS index with smart caching"""
+def _load_index_cached(storage_dir: str, mmap: bool | None = None):
+    """Load FAISS index with smart caching
+    
+    In mmap mode (default, ``RAG_INDEX_MMAP=0`` to disable) flat indexes are
+    served from the memory-mapped ``vectors.npy`` and IVF/HNSW indexes are
+    read with FAISS mmap flags, so processes share page-cache pages and
+    startup does not read the whole index.
+    
+    Ingest removes ``manifest.json`` before replacing any index file and
+    writes it back last, so the cache is keyed on the manifest. A load is
+    kept only if the manifest was unchanged throughout and the index, vector
+    and chunk counts agree. While an ingest is replacing files, the last
+    complete version keeps being served.
+    """
     global _INDEX_CACHE
     
+    if mmap is None:
+        mmap = _mmap_enabled()
+    
     storage_path = Path(storage_dir)
     index_path = storage_path / "faiss.index"
-    meta_path = storage_path / "chunks.json"
+    vectors_path = storage_path / "vectors.npy"
+    meta_path = storage_path / "chunks.bin"
+    if not meta_path.exists():
+        meta_path = storage_path / "chunks.json"  # Legacy metadata
     
-    if not index_path.exists() or not meta_path.exists():
-        raise RuntimeError("Index not found. Build index first.")
+    for attempt in range(50):
+        stamp = _manifest_stamp(storage_path)
+        if stamp is None:
+            for (cached_dir, _, cached_mmap), entry in reversed(_INDEX_CACHE.items()):
+                if cached_dir == str(storage_path) and cached_mmap == mmap:
+                    return entry  # Files are being replaced: keep serving the last complete version
+        
+        if not index_path.exists() or not meta_path.exists():
+            raise RuntimeError("Index not found. Build index first.")
+        
+        # Storage written before manifests existed is keyed by file modification times
+        version = stamp or (index_path.stat().st_mtime_ns, meta_path.stat().st_mtime_ns)
+        cache_key = (str(storage_path), version, mmap)
+        if cache_key in _INDEX_CACHE:
+            return _INDEX_CACHE[cache_key]
+        
+        try:
+            index, chunks = _read_index(index_path, vectors_path, meta_path, mmap)
+        except (RuntimeError, OSError, ValueError):
+            index = chunks = None  # A file was swapped mid-read
+        if (
+            index is not None
+            and index.ntotal == len(chunks)
+            and _manifest_stamp(storage_path) == stamp
+        ):
+            _INDEX_CACHE[cache_key] = (index, chunks)
+            
+            # Clear old cache entries (keep only latest)
+            if len(_INDEX_CACHE) > 1:
+                old_keys = list(_INDEX_CACHE.keys())[:-1]
+                for key in old_keys:
+                    del _INDEX_CACHE[key]
+            return index, chunks
+        time.sleep(0.1)
     
-    # Cache key based on file modification times
-    cache_key = f"{index_path.stat().st_mtime}_{meta_path.stat().st_mtime}"
+    raise RuntimeError("Index is being rebuilt and is not readable yet. Try again shortly.")
+
+
+def _read_index(index_path: Path, vectors_path: Path, meta_path: Path, mmap: bool):
+    """Open an index and its chunk metadata from disk"""
+    if meta_path.suffix == ".bin":
+        # Memory-mapped: rows are decoded on demand
+        chunks = ChunkStore(meta_path)
+    else:
+        chunk_list = json.loads(meta_path.read_text(encoding="utf-8"))
+        # Map FAISS vector IDs to chunks (legacy indexes use list positions)
+        chunks = {c.get("id", i): c for i, c in enumerate(chunk_list)}
     
-    if cache_key not in _INDEX_CACHE:
+    if mmap and vectors_path.exists() and isinstance(chunks, ChunkStore):
+        index = MappedFlatIndex(vectors_path, chunks.ids)
+    elif mmap:
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        try:
+            # Newer FAISS can also map flat code storage (HNSW); IVF lists reject it
+            index = faiss.read_index(str(index_path), flags | getattr(faiss, "IO_FLAG_MMAP_IFC", 0))
+        except RuntimeError:
+            index = faiss.read_index(str(index_path), flags)
+    else:
         index = faiss.read_index(str(index_path))
-        chunks = json.loads(meta_path.read_text(encoding="utf-8"))
-        _INDEX_CACHE[cache_key] = (index, chunks)
-        
-        # Clear old cache entries (keep only latest)
-        if len(_INDEX_CACHE) > 1:
-            old_keys = list(_INDEX_CACHE.keys())[:-1]
-            for key in old_keys:
-                del _INDEX_CACHE[key]
-    
-    return _INDEX_CACHE[cache_key]
+    return index, chunks
+
+
+def clear_index_cache() -> None:
+    """Drop cached indexes, releasing their memory-mapped metadata files"""
+    _INDEX_CACHE.clear()
 
 
 def get_cached_index(storage_dir: str):
@@ -52,39 +143,272 @@ def get_cached_index(storage_dir: str):
     return _load_index_cached(storage_dir)
 
 
+def _search_params(index, nprobe: int | None, ef_search: int | None):
+    """Per-request search knobs for IVF (nprobe) and HNSW (efSearch) indexes"""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if nprobe and isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=nprobe)
+    if ef_search and isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+
+def _search(
+    questions: List[str],
+    *,
+    storage_dir: str,
+    top_k: int,
+    embedding_model: str,
+    cache_func,
+    nprobe: int | None,
+    ef_search: int | None
+) -> Tuple[List[List[RetrievedChunk]], np.ndarray]:
+    """Retrieval results per question, plus the (n, dim) query vectors used"""
+    from rag.llm_client import embed_array, embed_query
+    
+    # Load index (cached)
+    load_func = cache_func if cache_func else _load_index_cached
+    index, chunks = load_func(storage_dir)
+    
+    # Generate all query vectors in one forward pass; single questions share
+    # forward passes with concurrent callers through the micro-batcher
+    if len(questions) == 1:
+        q_vecs = embed_query(questions[0], model=embedding_model)[None, :]
+    else:
+        q_vecs = embed_array(questions, model=embedding_model, persist=False)
+    
+    # Search the whole query matrix at once (FAISS is already optimized)
+    scores, ids = index.search(
+        q_vecs,
+        min(top_k, len(chunks)),
+        params=_search_params(index, nprobe, ef_search)
+    )
+    
+    # Build results
+    all_results = []
+    for score_row, id_row in zip(scores, ids):
+        results = []
+        for score, idx in zip(score_row, id_row):
+            chunk = chunks.get(int(idx))
+            if chunk is not None:
+                results.append(RetrievedChunk(
+                    text=chunk["text"],
+                    source=chunk.get("source", "unknown"),
+                    score=float(score),
+                    chunk_id=int(idx)
+                ))
+        all_results.append(results)
+    
+    return all_results, q_vecs
+
+
+def retrieve_many(
+    *,
+    questions: List[str],
+    storage_dir: str = "storage",
+    top_k: int = 3,
+    embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
+    cache_func=None,
+    nprobe: int | None = None,
+    ef_search: int | None = None
+) -> List[List[RetrievedChunk]]:
+    """Retrieve for many questions with one embedding batch and one FAISS search"""
+    if not questions:
+        return []
+    return _search(
+        questions,
+        storage_dir=storage_dir,
+        top_k=top_k,
+        embedding_model=embedding_model,
+        cache_func=cache_func,
+        nprobe=nprobe,
+        ef_search=ef_search
+    )[0]
+
+
 def retrieve(
     *,
     question: str,
     storage_dir: str = "storage",
     top_k: int = 3,
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
-    cache_func=None
+    cache_func=None,
+    nprobe: int | None = None,
+    ef_search: int | None = None
 ) -> List[RetrievedChunk]:
-    """Fast document retrieval with optimized search"""
-    from rag.llm_client import embed_texts
+    """Fast document retrieval with optimized search
     
-    # Load index (cached)
-    load_func = cache_func if cache_func else _load_index_cached
-    index, chunks = load_func(storage_dir)
+    ``nprobe`` (IVF) and ``ef_search`` (HNSW) trade latency for recall per
+    request; they are ignored by flat indexes.
+    """
+    return retrieve_many(
+        questions=[question],
+        storage_dir=storage_dir,
+        top_k=top_k,
+        embedding_model=embedding_model,
+        cache_func=cache_func,
+        nprobe=nprobe,
+        ef_search=ef_search
+    )[0]
+
+
+def _build_context(
+    retrieved: List[RetrievedChunk],
+    *,
+    question: str,
+    chat_model: str,
+    context_tokens: int,
+    stats: dict | None = None,
+    query_vector: np.ndarray | None = None,
+    embedding_model: str | None = None
+) -> str:
+    """Pack chunks into the token budget and report prompt size into ``stats``
+    
+    Given the question's ``query_vector``, chunks are first compressed to
+    their most relevant sentences (``rag.context.compress_chunks``).
+    """
+    from rag.context import compress_chunks, count_tokens, pack_context
+    from rag.llm_client import build_prompt
+    
+    started = time.perf_counter()
+    if query_vector is not None:
+        retrieved, compression = compress_chunks(
+            retrieved,
+            query_vector,
+            embedding_model=embedding_model,
+            chat_model=chat_model,
+            budget=context_tokens
+        )
+    packed = pack_context(retrieved, model=chat_model, budget=context_tokens)
+    if stats is not None:
+        stats.update({
+            "context_tokens": packed.tokens,
+            "prompt_tokens": count_tokens(build_prompt(question, packed.text), chat_model),
+            "chunks_packed": packed.chunks,
+            "chunks_merged": packed.merged,
+            "duplicates_dropped": packed.duplicates,
+            "context_truncated": packed.truncated,
+        })
+        if query_vector is not None:
+            stats.update({f"compress_{key}": value for key, value in compression.items()})
+        stats["context_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return packed.text
+
+
+def _answer_scope(
+    storage_dir: str, top_k: int, embedding_model: str, chat_model: str, context_tokens: int, compress: bool
+) -> tuple:
+    """Answer-cache key without the question: (storage, index version, answer settings...)"""
+    from rag.answer_cache import index_version
+    return (str(storage_dir), index_version(storage_dir), top_k, embedding_model, chat_model, context_tokens, compress)
+
+
+def _cached_result(entry, tier: str, stream: bool, stats: dict | None, started: float, similarity: float = 1.0):
+    """(answer, retrieved) from an answer-cache entry, shaped like a fresh result"""
+    if stats is not None:
+        stats.update({
+            "cache": tier,
+            "cache_similarity": round(similarity, 4),
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+    return (iter([entry.answer]) if stream else entry.answer), entry.retrieved
+
+
+def _caching_stream(tokens: Iterator[str], store) -> Iterator[str]:
+    """Pass tokens through and hand the full answer to ``store`` if the stream completes"""
+    parts = []
+    for token in tokens:
+        parts.append(token)
+        yield token
+    store("".join(parts))
+
+
+def _timed_stream(tokens: Iterator[str], stats: dict, started: float, shared: dict | None = None) -> Iterator[str]:
+    """Pass tokens through, recording end-to-end latency (and ``shared`` stats) when the stream ends"""
+    yield from tokens
+    if shared is not None:
+        stats.update(shared)
+    stats["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def _flight_key(scope: tuple, question: str, stream: bool) -> tuple:
+    from rag.answer_cache import normalize_question
+    return (*scope, normalize_question(question), stream)
+
+
+def coalescing_stats() -> dict:
+    """Single-flight counters of the threaded and asyncio answer paths combined"""
+    totals = _FLIGHTS.stats()
+    for flights in list(_ASYNC_FLIGHTS.values()):
+        for key, value in flights.stats().items():
+            totals[key] += value
+    return totals
+
+
+def _answer(
+    *,
+    question: str,
+    top_k: int,
+    storage_dir: str,
+    embedding_model: str,
+    chat_model: str,
+    cache_func,
+    stream: bool,
+    context_tokens: int,
+    stats: dict | None,
+    compress: bool,
+    cache,
+    scope: tuple | None,
+    started: float
+) -> Tuple[str | Iterator[str], List[RetrievedChunk]]:
+    """Retrieval through generation for ``answer_with_rag`` after an exact-cache miss"""
+    from rag.llm_client import chat_answer, chat_answer_stream
     
-    # Generate query vector
-    q_vec = np.array(embed_texts([question], model=embedding_model), dtype=np.float32)
+    # Retrieve relevant chunks
+    results, q_vecs = _search(
+        [question],
+        storage_dir=storage_dir,
+        top_k=top_k,
+        embedding_model=embedding_model,
+        cache_func=cache_func,
+        nprobe=None,
+        ef_search=None
+    )
+    retrieved = results[0]
+    if stats is not None:
+        stats["retrieve_ms"] = round((time.perf_counter() - started) * 1000, 1)
     
-    # Search (FAISS is already optimized)
-    scores, ids = index.search(q_vec, min(top_k, len(chunks)))
+    if not retrieved:
+        message = "No relevant information found in the documents."
+        return (iter([message]) if stream else message), []
     
-    # Build results
-    results = []
-    for score, idx in zip(scores[0], ids[0]):
-        if 0 <= idx < len(chunks):
-            chunk = chunks[idx]
-            results.append(RetrievedChunk(
-                text=chunk["text"],
-                source=chunk.get("source", "unknown"),
-                score=float(score)
-            ))
+    if cache is not None:
+        entry, similarity = cache.get_semantic(scope, q_vecs[0])
+        if entry is not None:
+            return _cached_result(entry, "semantic", stream, stats, started, similarity)
     
-    return results
+    # Generate answer
+    context = _build_context(
+        retrieved,
+        question=question,
+        chat_model=chat_model,
+        context_tokens=context_tokens,
+        stats=stats,
+        query_vector=q_vecs[0] if compress else None,
+        embedding_model=embedding_model
+    )
+    generate = chat_answer_stream if stream else chat_answer
+    answer = generate(question=question, context=context, model=chat_model, stats=stats)
+    
+    if cache is not None:
+        store = partial(cache.put, scope, question, q_vecs[0], retrieved=retrieved)
+        if stream:
+            answer = _caching_stream(answer, lambda text: store(answer=text))
+        else:
+            store(answer=answer)
+        if stats is not None:
+            stats["cache"] = "miss"
+    return answer, retrieved
 
 
 def answer_with_rag(
@@ -94,48 +418,355 @@ def answer_with_rag(
     storage_dir: str = "storage",
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
     chat_model: str = "llama3.2:1b",
-    cache_func=None
-) -> Tuple[str, List[RetrievedChunk]]:
-    """Complete RAG pipeline with optimized context building"""
-    from rag.llm_client import chat_answer
+    cache_func=None,
+    stream: bool = False,
+    context_tokens: int = 300,
+    stats: dict | None = None,
+    compress: bool = False,
+    use_cache: bool = True,
+    coalesce: bool = True
+) -> Tuple[str | Iterator[str], List[RetrievedChunk]]:
+    """Complete RAG pipeline with optimized context building
     
-    # Retrieve relevant chunks
-    retrieved = retrieve(
+    With ``stream=True`` the retrieved chunks are returned immediately
+    together with an iterator of answer tokens.
+    
+    Context is packed into ``context_tokens`` tokens of the chat model (see
+    ``rag.context``). ``stats``, if given, receives the estimated
+    ``prompt_tokens`` and packing counts, plus Ollama's own counts and
+    timings once generation finishes (end of stream when streaming).
+    
+    ``compress=True`` keeps only the chunk sentences closest to the query
+    vector; ``stats`` then shows the token reduction (``compress_*``) and
+    the end-to-end ``total_ms``.
+    
+    Answers are served from the two-tier answer cache (``rag.answer_cache``)
+    when the same or a near-identical question was answered against the same
+    index and settings; ``stats["cache"]`` names the tier that hit.
+    ``use_cache=False`` bypasses it.
+    
+    Concurrent calls with the same cache key attach to the one computation
+    already in flight (``rag.singleflight``) and receive its answer, or
+    replay and then follow its token stream; their ``stats`` are the
+    leader's with ``coalesced`` set. ``coalesce=False`` opts out.
+    """
+    from rag.answer_cache import get_answer_cache
+    
+    started = time.perf_counter()
+    cache = get_answer_cache() if use_cache else None
+    scope = None
+    if cache is not None or coalesce:
+        scope = _answer_scope(storage_dir, top_k, embedding_model, chat_model, context_tokens, compress)
+    if cache is not None:
+        entry = cache.get_exact(scope, question)
+        if entry is not None:
+            return _cached_result(entry, "exact", stream, stats, started)
+    
+    run = partial(
+        _answer,
         question=question,
+        top_k=top_k,
+        storage_dir=storage_dir,
+        embedding_model=embedding_model,
+        chat_model=chat_model,
+        cache_func=cache_func,
+        stream=stream,
+        context_tokens=context_tokens,
+        compress=compress,
+        cache=cache,
+        scope=scope,
+        started=started
+    )
+    if not coalesce:
+        answer, retrieved = run(stats=stats)
+        if stats is not None:
+            if stream:
+                answer = _timed_stream(answer, stats, started)
+            else:
+                stats["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return answer, retrieved
+    
+    # The leader fills ``shared``; every caller copies it into its own stats
+    def lead():
+        shared = {}
+        answer, retrieved = run(stats=shared)
+        return (answer, (retrieved, shared)) if stream else (answer, retrieved, shared)
+    
+    key = _flight_key(scope, question, stream)
+    if stream:
+        (answer, (retrieved, shared)), coalesced = _FLIGHTS.do_stream(key, lead)
+    else:
+        (answer, retrieved, shared), coalesced = _FLIGHTS.do(key, lead)
+    if stats is not None:
+        stats.update(shared)
+        if coalesced:
+            stats["coalesced"] = True
+        if stream:
+            answer = _timed_stream(answer, stats, started, shared)
+        else:
+            stats["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return answer, retrieved
+
+
+def answer_with_rag_many(
+    *,
+    questions: List[str],
+    top_k: int = 3,
+    storage_dir: str = "storage",
+    embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
+    chat_model: str = "llama3.2:1b",
+    cache_func=None,
+    concurrency: int = 1,
+    context_tokens: int = 300,
+    compress: bool = False
+) -> List[Tuple[str, List[RetrievedChunk]]]:
+    """Batch RAG: one retrieval pass for all questions, then one generation each
+    
+    ``concurrency`` > 1 overlaps generations (useful when Ollama runs with
+    ``OLLAMA_NUM_PARALLEL`` > 1); results keep the order of ``questions``.
+    """
+    from rag.llm_client import chat_answer
+    
+    if not questions:
+        return []
+    all_retrieved, q_vecs = _search(
+        questions,
         storage_dir=storage_dir,
         top_k=top_k,
         embedding_model=embedding_model,
-        cache_func=cache_func
+        cache_func=cache_func,
+        nprobe=None,
+        ef_search=None
     )
     
+    def generate(item: Tuple[str, List[RetrievedChunk], np.ndarray]) -> Tuple[str, List[RetrievedChunk]]:
+        question, retrieved, q_vec = item
+        if not retrieved:
+            return "No relevant information found in the documents.", []
+        answer = chat_answer(
+            question=question,
+            context=_build_context(
+                retrieved,
+                question=question,
+                chat_model=chat_model,
+                context_tokens=context_tokens,
+                query_vector=q_vec if compress else None,
+                embedding_model=embedding_model
+            ),
+            model=chat_model
+        )
+        return answer, retrieved
+    
+    items = list(zip(questions, all_retrieved, q_vecs))
+    if concurrency <= 1:
+        return [generate(item) for item in items]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(generate, items))
+
+
+_CPU_EXECUTOR = None
+
+
+def _cpu_executor() -> ThreadPoolExecutor:
+    """Bounded pool for embedding and FAISS work issued from async code"""
+    global _CPU_EXECUTOR
+    if _CPU_EXECUTOR is None:
+        workers = int(os.getenv("RAG_CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+        _CPU_EXECUTOR = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-cpu")
+    return _CPU_EXECUTOR
+
+
+async def retrieve_many_async(**kwargs) -> List[List[RetrievedChunk]]:
+    """``retrieve_many`` on the bounded CPU executor (same keyword arguments)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_cpu_executor(), partial(retrieve_many, **kwargs))
+
+
+async def retrieve_async(**kwargs) -> List[RetrievedChunk]:
+    """``retrieve`` on the bounded CPU executor (same keyword arguments)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_cpu_executor(), partial(retrieve, **kwargs))
+
+
+def _async_flights() -> AsyncSingleFlight:
+    """Single-flight registry of the running event loop"""
+    loop = asyncio.get_running_loop()
+    flights = _ASYNC_FLIGHTS.get(loop)
+    if flights is None:
+        flights = _ASYNC_FLIGHTS[loop] = AsyncSingleFlight()
+    return flights
+
+
+async def _answer_async(
+    *,
+    question: str,
+    top_k: int,
+    storage_dir: str,
+    embedding_model: str,
+    chat_model: str,
+    cache_func,
+    stream: bool,
+    context_tokens: int,
+    stats: dict | None,
+    compress: bool,
+    cache,
+    scope: tuple | None,
+    started: float
+) -> Tuple[str | AsyncIterator[str], List[RetrievedChunk]]:
+    """Async ``_answer``"""
+    from rag.llm_client import chat_answer_async, chat_answer_stream_async
+    
+    loop = asyncio.get_running_loop()
+    results, q_vecs = await loop.run_in_executor(_cpu_executor(), partial(
+        _search,
+        [question],
+        storage_dir=storage_dir,
+        top_k=top_k,
+        embedding_model=embedding_model,
+        cache_func=cache_func,
+        nprobe=None,
+        ef_search=None
+    ))
+    retrieved = results[0]
+    if stats is not None:
+        stats["retrieve_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    
     if not retrieved:
-        return "No relevant information found in the documents.", []
-    
-    # Build optimized context (limit total length)
-    context_parts = []
-    total_length = 0
-    max_context = 800  # Reduced for speed
-    
-    for chunk in retrieved:
-        chunk_text = f"[{chunk.source}] {chunk.text}"
-        if total_length + len(chunk_text) > max_context:
-            # Truncate last chunk to fit
-            remaining = max_context - total_length
-            if remaining > 50:  # Only add if substantial
-                chunk_text = chunk_text[:remaining] + "..."
-                context_parts.append(chunk_text)
-            break
-        
-        context_parts.append(chunk_text)
-        total_length += len(chunk_text)
+        return _async_result("No relevant information found in the documents.", [], stream)
     
-    context = "\n\n".join(context_parts)
+    if cache is not None:
+        entry, similarity = cache.get_semantic(scope, q_vecs[0])
+        if entry is not None:
+            return _async_result(*_cached_result(entry, "semantic", False, stats, started, similarity), stream)
     
-    # Generate answer
-    answer = chat_answer(
+    # Packing (and compression, which embeds sentences) is CPU work too
+    context = await loop.run_in_executor(_cpu_executor(), partial(
+        _build_context,
+        retrieved,
+        question=question,
+        chat_model=chat_model,
+        context_tokens=context_tokens,
+        stats=stats,
+        query_vector=q_vecs[0] if compress else None,
+        embedding_model=embedding_model
+    ))
+    kwargs = {"question": question, "context": context, "model": chat_model, "stats": stats}
+    store = partial(cache.put, scope, question, q_vecs[0], retrieved=retrieved) if cache is not None else None
+    if stats is not None and cache is not None:
+        stats["cache"] = "miss"
+    if stream:
+        tokens = chat_answer_stream_async(**kwargs)
+        if store is not None:
+            tokens = _caching_stream_async(tokens, lambda text: store(answer=text))
+        return tokens, retrieved
+    answer = await chat_answer_async(**kwargs)
+    if store is not None:
+        store(answer=answer)
+    return answer, retrieved
+
+
+async def answer_with_rag_async(
+    *,
+    question: str,
+    top_k: int = 3,
+    storage_dir: str = "storage",
+    embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
+    chat_model: str = "llama3.2:1b",
+    cache_func=None,
+    stream: bool = False,
+    context_tokens: int = 300,
+    stats: dict | None = None,
+    compress: bool = False,
+    use_cache: bool = True,
+    coalesce: bool = True
+) -> Tuple[str | AsyncIterator[str], List[RetrievedChunk]]:
+    """asyncio-native RAG pipeline
+    
+    Embedding and search run on a bounded thread pool (``RAG_CPU_WORKERS``)
+    while generation uses non-blocking HTTP, so one event loop can keep many
+    questions in flight. ``stream=True`` returns an async token iterator.
+    ``context_tokens``, ``stats``, ``compress``, the answer cache and
+    ``coalesce`` work as in ``answer_with_rag`` (coalescing per event loop).
+    """
+    from rag.answer_cache import get_answer_cache
+    
+    started = time.perf_counter()
+    cache = get_answer_cache() if use_cache else None
+    scope = None
+    if cache is not None or coalesce:
+        scope = _answer_scope(storage_dir, top_k, embedding_model, chat_model, context_tokens, compress)
+    if cache is not None:
+        entry = cache.get_exact(scope, question)
+        if entry is not None:
+            return _async_result(*_cached_result(entry, "exact", False, stats, started), stream)
+    
+    run = partial(
+        _answer_async,
         question=question,
-        context=context,
-        model=chat_model
+        top_k=top_k,
+        storage_dir=storage_dir,
+        embedding_model=embedding_model,
+        chat_model=chat_model,
+        cache_func=cache_func,
+        stream=stream,
+        context_tokens=context_tokens,
+        compress=compress,
+        cache=cache,
+        scope=scope,
+        started=started
     )
+    if not coalesce:
+        answer, retrieved = await run(stats=stats)
+        shared, coalesced = None, False
+    else:
+        async def lead():
+            shared = {}
+            answer, retrieved = await run(stats=shared)
+            return (answer, (retrieved, shared)) if stream else (answer, retrieved, shared)
+        
+        key = _flight_key(scope, question, stream)
+        if stream:
+            (answer, (retrieved, shared)), coalesced = await _async_flights().do_stream(key, lead)
+        else:
+            (answer, retrieved, shared), coalesced = await _async_flights().do(key, lead)
     
+    if stats is not None:
+        if shared is not None:
+            stats.update(shared)
+        if coalesced:
+            stats["coalesced"] = True
+        if stream:
+            answer = _timed_stream_async(answer, stats, started, shared)
+        else:
+            stats["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
     return answer, retrieved
+
+
+def _async_result(answer: str, retrieved: List[RetrievedChunk], stream: bool):
+    """(answer, retrieved) with the answer as a one-token async stream when streaming"""
+    if not stream:
+        return answer, retrieved
+    
+    async def single():
+        yield answer
+    return single(), retrieved
+
+
+async def _caching_stream_async(tokens: AsyncIterator[str], store) -> AsyncIterator[str]:
+    """Async ``_caching_stream``"""
+    parts = []
+    async for token in tokens:
+        parts.append(token)
+        yield token
+    store("".join(parts))
+
+
+async def _timed_stream_async(
+    tokens: AsyncIterator[str], stats: dict, started: float, shared: dict | None = None
+) -> AsyncIterator[str]:
+    """Async ``_timed_stream``"""
+    async for token in tokens:
+        yield token
+    if shared is not None:
+        stats.update(shared)
+    stats["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
@@ -0,0 +1,153 @@
+"""Keep chat models resident and warm on the Ollama server(s)
+
+Ollama loads a model on its first request and unloads it after
+``keep_alive`` of idleness, so a model switch or a quiet spell costs the
+next question several seconds of loading. This module:
+
+- sends a per-model ``keep_alive`` with every request. ``RAG_KEEP_ALIVE``
+  is either one duration (``30m``, the default) or a map such as
+  ``llama3.2:1b=-1,qwen2.5:3b=5m,*=30m``. ``-1`` keeps a model loaded
+  until Ollama restarts.
+- warms models on every endpoint with a one-token generation built by
+  the same ``_generate_payload`` as real questions. Identical runner
+  options mean the loaded runner is reused rather than reloaded, and the
+  prompt template's prefix is already evaluated. ``RAG_PRELOAD_MODELS``
+  (``llama3.2:1b``; empty to skip) lists the models warmed at startup.
+- reports which models are hot (``/api/ps``) so callers can steer away
+  from cold paths.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List
+
+from rag.http_clients import get_session
+from rag.ollama_pool import _tagged, get_pool, ollama_urls
+
+
+def _duration(value: str) -> int | str:
+    """Ollama duration: plain numbers are seconds (and ``-1`` means forever)"""
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+class ResidencyManager:
+    """Per-model keep-alive, warm-up and hot-model tracking"""
+
+    def __init__(self, keep_alive: str = "30m", *, hot_ttl: float = 5.0):
+        self._keep_alive = {}
+        self._default_keep_alive = None
+        for part in keep_alive.split(","):
+            model, sep, value = part.strip().rpartition("=")
+            if not value:
+                continue
+            if sep and model != "*":
+                self._keep_alive[_tagged(model)] = _duration(value)
+            else:
+                self._default_keep_alive = _duration(value)
+        self.hot_ttl = hot_ttl
+        self._lock = threading.Lock()
+        self._hot = None
+        self._hot_at = 0.0
+        self.warmups = {}  # model -> last warm-up duration per endpoint (ms)
+
+    def keep_alive(self, model: str) -> int | str | None:
+        """``keep_alive`` to send with requests for ``model`` (None: server default)"""
+        return self._keep_alive.get(_tagged(model), self._default_keep_alive)
+
+    def warm(self, model: str, url: str) -> float:
+        """Load and warm ``model`` on one endpoint; returns the milliseconds it took"""
+        from rag.llm_client import _generate_payload
+
+        payload = _generate_payload(question="Ready?", context="Warm-up.", model=model, max_tokens=1, stream=False)
+        started = time.perf_counter()
+        response = get_session().post(f"{url}/api/generate", json=payload, timeout=(5, 300))
+        response.raise_for_status()
+        elapsed = round((time.perf_counter() - started) * 1000, 1)
+        with self._lock:
+            self.warmups.setdefault(model, {})[url] = elapsed
+            self._hot = None  # Residency changed
+        return elapsed
+
+    def preload(self, models: List[str]) -> Dict[str, Dict[str, float | str]]:
+        """Warm ``models`` on every endpoint (endpoints in parallel, models in order)
+
+        Returns milliseconds per model and endpoint, or the error message
+        where warming failed (e.g. model not pulled, server down).
+        """
+        urls = ollama_urls()
+        results = {model: {} for model in models}
+
+        def warm_endpoint(url: str) -> None:
+            for model in models:
+                try:
+                    results[model][url] = self.warm(model, url)
+                except Exception as e:
+                    results[model][url] = str(e)
+
+        with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+            list(pool.map(warm_endpoint, urls))
+        if get_pool() is not None:
+            get_pool().check_all()  # Let routing see the new residency right away
+        return results
+
+    def hot_models(self) -> Dict[str, List[str]]:
+        """Resident models and the endpoints holding them (cached ``hot_ttl`` seconds)"""
+        with self._lock:
+            if self._hot is not None and time.monotonic() - self._hot_at < self.hot_ttl:
+                return self._hot
+        hot = {}
+        for url in ollama_urls():
+            try:
+                response = get_session().get(f"{url}/api/ps", timeout=2)
+                response.raise_for_status()
+                models = response.json().get("models", [])
+            except Exception:
+                continue  # An unreachable endpoint holds nothing
+            for m in models:
+                hot.setdefault(_tagged(m.get("name") or m.get("model")), []).append(url)
+        with self._lock:
+            self._hot, self._hot_at = hot, time.monotonic()
+        return hot
+
+    def is_hot(self, model: str) -> bool:
+        return _tagged(model) in self.hot_models()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "keep_alive": {**self._keep_alive, "*": self._default_keep_alive},
+                "warmup_ms": {model: dict(urls) for model, urls in self.warmups.items()},
+            }
+
+
+@lru_cache(maxsize=1)
+def get_residency() -> ResidencyManager:
+    """Process-wide manager configured via RAG_KEEP_ALIVE"""
+    return ResidencyManager(os.getenv("RAG_KEEP_ALIVE", "30m"))
+
+
+def preload_models(models: List[str] | None = None) -> Dict[str, Dict[str, float | str]]:
+    """Warm ``models`` (default: ``RAG_PRELOAD_MODELS``) on every Ollama endpoint
+    
+    Their prompt tokenizers (if ``RAG_CHAT_TOKENIZER`` enables them) are
+    loaded as well.
+    """
+    from rag.context import _tokenizer
+
+    if models is None:
+        models = [m.strip() for m in os.getenv("RAG_PRELOAD_MODELS", "llama3.2:1b").split(",") if m.strip()]
+    for model in models:
+        _tokenizer(model)
+    return get_residency().preload(models) if models else {}
+
+
+def warm_in_background(models: List[str] | None = None) -> threading.Thread:
+    """``preload_models`` on a daemon thread (e.g. while a UI starts up)"""
+    thread = threading.Thread(target=preload_models, args=(models,), name="model-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,191 @@
+"""Admission control in front of the LLM backend
+
+At most ``max_concurrent`` generations run at once per process; further
+requests wait in one bounded FIFO queue shared by threads and event loops.
+A request is rejected at once with ``BackendBusy`` when the queue is full,
+and it also gets ``BackendBusy`` if it is still queued when its deadline
+(``timeout`` seconds after arrival) passes. Under overload, callers fail
+fast and can retry, and the queue never hits the HTTP timeout. Admitted
+requests run at the speed Ollama manages with a bounded number of parallel
+generations.
+
+Configured by ``RAG_LLM_CONCURRENCY`` (4 per Ollama endpoint, ``0`` disables),
+``RAG_LLM_QUEUE`` (queued requests, 32) and ``RAG_LLM_QUEUE_TIMEOUT``
+(seconds, 30).
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Iterator
+import numpy as np
+
+
+class BackendBusy(RuntimeError):
+    """The LLM backend is saturated; retry later"""
+
+
+class _Waiter:
+    def __init__(self, notify):
+        self.notify = notify
+        self.granted = False
+
+
+class BackendScheduler:
+    """Concurrency limit plus bounded FIFO queue with deadlines
+
+    A finishing request hands its slot straight to the oldest waiter, so
+    admission order is arrival order for sync and async callers alike.
+    """
+
+    def __init__(self, *, max_concurrent: int = 4, max_queue: int = 32, timeout: float = 30.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self._active = 0
+        self.admitted = self.rejected = self.timed_out = 0
+        self._waits = deque(maxlen=1024)  # Recent queue waits in seconds
+
+    def _enter(self, notify) -> _Waiter | None:
+        """Take a free slot (None) or join the queue (the waiter); raise when full"""
+        with self._lock:
+            if self._active < self.max_concurrent and not self._queue:
+                self._active += 1
+                return None
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise BackendBusy(
+                    f"LLM backend busy: {self._active} generating, {len(self._queue)} queued. Try again shortly."
+                )
+            waiter = _Waiter(notify)
+            self._queue.append(waiter)
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Leave the queue; True if the slot was granted meanwhile (the caller now owns it)"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._queue.remove(waiter)
+            return False
+
+    def _admitted(self, arrived: float, stats: dict | None) -> None:
+        waited = time.perf_counter() - arrived
+        with self._lock:
+            self.admitted += 1
+            self._waits.append(waited)
+        if stats is not None:
+            stats["queue_ms"] = round(waited * 1000, 1)
+
+    def _timeout_error(self) -> BackendBusy:
+        with self._lock:
+            self.timed_out += 1
+        return BackendBusy(f"LLM backend busy: no slot within {self.timeout:g} s. Try again shortly.")
+
+    def release(self) -> None:
+        """Free a slot, handing it to the oldest waiter if there is one"""
+        with self._lock:
+            if self._queue:
+                waiter = self._queue.popleft()
+                waiter.granted = True
+                waiter.notify()
+                return
+            self._active -= 1
+
+    @contextmanager
+    def slot(self, stats: dict | None = None) -> Iterator[None]:
+        """Hold one generation slot (blocking); ``stats`` receives ``queue_ms``"""
+        arrived = time.perf_counter()
+        granted = threading.Event()
+        waiter = self._enter(granted.set)
+        if waiter is not None and not granted.wait(self.timeout) and not self._abandon(waiter):
+            raise self._timeout_error()
+        self._admitted(arrived, stats)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def slot_async(self, stats: dict | None = None) -> AsyncIterator[None]:
+        """``slot`` for coroutines: waits without blocking the event loop"""
+        arrived = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+        waiter = self._enter(notify)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), self.timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise self._timeout_error()
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    self.release()  # Granted just as we gave up: pass it on
+                raise
+        self._admitted(arrived, stats)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        """Occupancy, queue-depth and queue-wait metrics"""
+        with self._lock:
+            waits = np.array(self._waits) * 1000 if self._waits else np.zeros(1)
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queue_depth": len(self._queue),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "queue_wait_ms_avg": round(float(waits.mean()), 1),
+                "queue_wait_ms_p95": round(float(np.percentile(waits, 95)), 1),
+                "timeout_s": self.timeout,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_scheduler() -> BackendScheduler | None:
+    """Process-wide scheduler configured via RAG_LLM_* (None when disabled)"""
+    from rag.ollama_pool import ollama_urls
+    max_concurrent = int(os.getenv("RAG_LLM_CONCURRENCY", str(4 * len(ollama_urls()))))
+    if max_concurrent <= 0:
+        return None
+    return BackendScheduler(
+        max_concurrent=max_concurrent,
+        max_queue=int(os.getenv("RAG_LLM_QUEUE", "32")),
+        timeout=float(os.getenv("RAG_LLM_QUEUE_TIMEOUT", "30")),
+    )
+
+
+@contextmanager
+def backend_slot(stats: dict | None = None) -> Iterator[None]:
+    """Generation slot from the process-wide scheduler (no-op when disabled)"""
+    scheduler = get_scheduler()
+    if scheduler is None:
+        yield
+        return
+    with scheduler.slot(stats):
+        yield
+
+
+@asynccontextmanager
+async def backend_slot_async(stats: dict | None = None) -> AsyncIterator[None]:
+    """Async ``backend_slot``"""
+    scheduler = get_scheduler()
+    if scheduler is None:
+        yield
+        return
+    async with scheduler.slot_async(stats):
+        yield
@@ -0,0 +1,235 @@
+"""Single-flight coalescing of identical in-flight work
+
+The first caller for a key (the leader) runs the computation; callers that
+arrive with the same key while it is in flight wait for it and share its
+result instead of repeating it. For streamed answers the leader's token
+iterator is wrapped in a shared stream. Every caller, including late
+joiners, replays the tokens produced so far and then follows the live
+ones. The key stays in flight until the stream ends.
+
+``SingleFlight`` serves threads and ``AsyncSingleFlight`` serves one
+event loop.
+"""
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, Iterator, Tuple
+
+
+class SharedStream:
+    """Fan a token iterator out to any number of subscribers
+
+    A background thread drains the source from construction on, whether or
+    not anyone is reading, so the in-flight key is always released and side
+    effects at the end of the source (e.g. caching) still happen.
+    """
+
+    def __init__(self, source: Iterator[str], on_done: Callable[[], None] | None = None):
+        self._source = source
+        self._on_done = on_done
+        self._tokens = []
+        self._done = False
+        self._error = None
+        self._cond = threading.Condition()
+        threading.Thread(target=self._pump, name="shared-stream", daemon=True).start()
+
+    def _pump(self) -> None:
+        try:
+            for token in self._source:
+                with self._cond:
+                    self._tokens.append(token)
+                    self._cond.notify_all()
+        except BaseException as e:
+            self._error = e
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+            if self._on_done:
+                self._on_done()
+
+    def subscribe(self) -> Iterator[str]:
+        seen = 0
+        while True:
+            with self._cond:
+                while seen >= len(self._tokens) and not self._done:
+                    self._cond.wait()
+                fresh = self._tokens[seen:]
+                seen = len(self._tokens)
+                done, error = self._done, self._error
+            yield from fresh
+            if done and seen >= len(self._tokens):
+                if error is not None:
+                    raise error
+                return
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Thread-safe coalescing of calls by key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def _join(self, key: Hashable) -> Tuple[_Call, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.followers += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self.leaders += 1
+            return call, True
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """(result of ``fn``, whether it was shared from another caller)"""
+        call, leader = self._join(key)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._forget(key, call)
+            call.done.set()
+
+    def do_stream(self, key: Hashable, fn: Callable[[], Tuple[Iterator[str], Any]]) -> Tuple[Tuple[Iterator[str], Any], bool]:
+        """Like ``do`` for ``fn`` returning (token iterator, extra); each caller gets its own view"""
+        call, leader = self._join(key)
+        if leader:
+            try:
+                tokens, extra = fn()
+            except BaseException as e:
+                call.error = e
+                self._forget(key, call)
+                call.done.set()
+                raise
+            call.result = (SharedStream(tokens, on_done=lambda: self._forget(key, call)), extra)
+            call.done.set()
+        else:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+        shared, extra = call.result
+        return (shared.subscribe(), extra), not leader
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.followers, "in_flight": len(self._calls)}
+
+
+class AsyncSharedStream:
+    """``SharedStream`` for async token iterators (pumped by a task on the loop)"""
+
+    def __init__(self, source: AsyncIterator[str], on_done: Callable[[], None] | None = None):
+        self._source = source
+        self._on_done = on_done
+        self._tokens = []
+        self._done = False
+        self._error = None
+        self._changed = asyncio.Condition()
+        self._task = asyncio.ensure_future(self._pump())
+
+    async def _pump(self) -> None:
+        try:
+            async for token in self._source:
+                async with self._changed:
+                    self._tokens.append(token)
+                    self._changed.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            async with self._changed:
+                self._done = True
+                self._changed.notify_all()
+            if self._on_done:
+                self._on_done()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        seen = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: seen < len(self._tokens) or self._done)
+                fresh = self._tokens[seen:]
+                seen = len(self._tokens)
+                done, error = self._done, self._error
+            for token in fresh:
+                yield token
+            if done and seen >= len(self._tokens):
+                if error is not None:
+                    raise error
+                return
+
+
+class AsyncSingleFlight:
+    """Coalescing of coroutine calls by key within one event loop
+
+    The shared work runs as its own task, so a caller being cancelled (e.g.
+    a client disconnecting) never cancels it for the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def _join(self, key: Hashable, start: Callable[[], Awaitable[Any]]) -> Tuple[asyncio.Future, bool]:
+        task = self._calls.get(key)
+        if task is not None:
+            self.followers += 1
+            return task, False
+        self.leaders += 1
+        task = self._calls[key] = asyncio.ensure_future(start())
+        task.add_done_callback(lambda t: self._settle(key, t))
+        return task, True
+
+    def _settle(self, key: Hashable, task: asyncio.Future) -> None:
+        if task.cancelled() or task.exception() is not None or not isinstance(task.result()[0], AsyncSharedStream):
+            self._forget(key, task)  # Streams leave when they end (see do_stream)
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """(result of ``await fn()``, whether it was shared from another caller)"""
+        async def start():
+            return (await fn(),)
+        task, leader = self._join(key, start)
+        (result,) = await asyncio.shield(task)
+        return result, not leader
+
+    async def do_stream(
+        self, key: Hashable, fn: Callable[[], Awaitable[Tuple[AsyncIterator[str], Any]]]
+    ) -> Tuple[Tuple[AsyncIterator[str], Any], bool]:
+        """Like ``do`` for ``fn`` returning (async token iterator, extra)"""
+        task = None
+
+        async def start():
+            tokens, extra = await fn()
+            return AsyncSharedStream(tokens, on_done=lambda: self._forget(key, task)), extra
+        task, leader = self._join(key, start)
+        shared, extra = await asyncio.shield(task)
+        return (shared.subscribe(), extra), not leader
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "coalesced": self.followers, "in_flight": len(self._calls)}
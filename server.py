@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+🛰️ AskAce: D'RAG - Headless HTTP query service
+Loads the embedder and index once per worker and serves JSON endpoints:
+
+    GET  /health     liveness and index status
+    GET  /metrics    per-worker batching, cache, LLM queue, endpoint and
+                     hot-model metrics
+    POST /retrieve   {"question" | "questions", "top_k", ...}
+    POST /answer     {"question", "top_k", "chat_model", "stream", ...}
+    POST /ingest     {"chunk_size", "chunk_overlap", "index_type", ...}
+                     (runs in a spawned process; 504 after --ingest-timeout)
+
+Streaming answers are NDJSON: a ``sources`` line, then ``token`` lines,
+then a ``done`` line carrying prompt-size and timing ``stats``. When the
+LLM queue is full (see ``rag.scheduler``) /answer returns 503 with
+``Retry-After``, or an ``error`` line once a stream has started. Indexes
+are reloaded when their files change (or on SIGHUP), so an ingest in any
+worker is picked up by all of them.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict
+from pathlib import Path
+
+import tornado.httpserver
+import tornado.iostream
+import tornado.netutil
+import tornado.web
+
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_CHAT_MODEL = "llama3.2:1b"
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    """JSON request/response helpers and in-flight tracking for graceful shutdown"""
+
+    inflight = 0
+
+    def prepare(self):
+        BaseHandler.inflight += 1
+
+    def on_finish(self):
+        BaseHandler.inflight -= 1
+
+    @property
+    def options(self) -> argparse.Namespace:
+        return self.application.settings["options"]
+
+    def body_json(self) -> dict:
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="Body must be JSON")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, reason="Body must be a JSON object")
+        return body
+
+    def write_error(self, status_code: int, **kwargs) -> None:
+        self.set_header("Content-Type", "application/json")
+        if status_code == 503:
+            self.set_header("Retry-After", "1")
+        message = self._reason
+        if "exc_info" in kwargs and not isinstance(kwargs["exc_info"][1], tornado.web.HTTPError):
+            message = str(kwargs["exc_info"][1])
+        self.finish({"error": message})
+
+    def body_int(self, body: dict, name: str, default: int | None = None) -> int | None:
+        """Integer field of the body, ``default`` when absent; 400 when not an integer"""
+        value = body.get(name)
+        if value is None or value == "":
+            return default
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise tornado.web.HTTPError(400, reason=f"'{name}' must be an integer")
+
+    def retrieval_kwargs(self, body: dict) -> dict:
+        return {
+            "storage_dir": self.options.storage_dir,
+            "top_k": self.body_int(body, "top_k", 3),
+            "embedding_model": body.get("embedding_model", DEFAULT_EMBEDDING_MODEL),
+            "nprobe": self.body_int(body, "nprobe") or None,
+            "ef_search": self.body_int(body, "ef_search") or None,
+        }
+
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        index_ready = (Path(self.options.storage_dir) / "faiss.index").exists()
+        self.finish({"status": "ok", "index": index_ready, "pid": os.getpid()})
+
+
+class MetricsHandler(BaseHandler):
+    async def get(self):
+        from rag.answer_cache import get_answer_cache
+        from rag.embed_cache import get_embedding_cache, get_query_embedding_cache
+        from rag.llm_client import query_batch_stats
+        from rag.ollama_pool import get_pool
+        from rag.rag_core import coalescing_stats
+        from rag.residency import get_residency
+        from rag.scheduler import get_scheduler
+
+        cache = get_embedding_cache(self.options.storage_dir)
+        query_cache = get_query_embedding_cache()
+        answers = get_answer_cache()
+        scheduler = get_scheduler()
+        pool = get_pool()
+        residency = get_residency()
+        hot = await asyncio.get_running_loop().run_in_executor(None, residency.hot_models)  # Queries Ollama
+        self.finish({
+            "pid": os.getpid(),
+            "inflight": BaseHandler.inflight,
+            "query_batching": query_batch_stats(),
+            "embed_cache": cache.stats() if cache else None,
+            "query_embed_cache": query_cache.stats() if query_cache else None,
+            "answer_cache": answers.stats() if answers else None,
+            "coalescing": coalescing_stats(),
+            "llm_queue": scheduler.stats() if scheduler else None,
+            "ollama_pool": pool.stats() if pool else None,
+            "models": {"hot": hot, **residency.stats()},
+        })
+
+
+class RetrieveHandler(BaseHandler):
+    async def post(self):
+        from rag.rag_core import retrieve_many_async
+
+        body = self.body_json()
+        questions = body.get("questions") or ([body["question"]] if body.get("question") else [])
+        if not questions:
+            raise tornado.web.HTTPError(400, reason="Provide 'question' or 'questions'")
+
+        results = await retrieve_many_async(questions=questions, **self.retrieval_kwargs(body))
+        chunks = [[asdict(c) for c in retrieved] for retrieved in results]
+        self.finish({"results": chunks} if "questions" in body else {"chunks": chunks[0]})
+
+
+class AnswerHandler(BaseHandler):
+    async def post(self):
+        from rag.rag_core import answer_with_rag_async
+        from rag.scheduler import BackendBusy
+
+        body = self.body_json()
+        if not body.get("question"):
+            raise tornado.web.HTTPError(400, reason="Provide 'question'")
+        stream = bool(body.get("stream", False))
+        stats = {}
+
+        try:
+            answer, retrieved = await answer_with_rag_async(
+                question=body["question"],
+                top_k=self.body_int(body, "top_k", 3),
+                storage_dir=self.options.storage_dir,
+                embedding_model=body.get("embedding_model", DEFAULT_EMBEDDING_MODEL),
+                chat_model=body.get("chat_model", DEFAULT_CHAT_MODEL),
+                stream=stream,
+                context_tokens=self.body_int(body, "context_tokens", 300),
+                stats=stats,
+                compress=bool(body.get("compress", False)),
+                use_cache=bool(body.get("use_cache", True)),
+                coalesce=bool(body.get("coalesce", True)),
+            )
+        except BackendBusy as e:
+            raise tornado.web.HTTPError(503, reason=str(e))
+        sources = [asdict(c) for c in retrieved]
+
+        if not stream:
+            self.finish({"answer": answer, "sources": sources, "stats": stats})
+            return
+
+        self.set_header("Content-Type", "application/x-ndjson")
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("X-Accel-Buffering", "no")  # Let nginx pass tokens through
+        await self._send_line({"sources": sources})
+        try:
+            async for token in answer:
+                await self._send_line({"token": token})
+        except RuntimeError as e:
+            await self._send_line({"error": str(e)})
+        except tornado.iostream.StreamClosedError:
+            return  # Client went away
+        await self._send_line({"done": True, "stats": stats})
+        self.finish()
+
+    async def _send_line(self, message: dict) -> None:
+        self.write(json.dumps(message, ensure_ascii=False) + "\n")
+        await self.flush()
+
+
+async def run_in_subprocess(func, timeout: float):
+    """Await ``func()`` in a freshly spawned process, killing it after ``timeout`` seconds
+
+    A hung or crashing job then costs its own process, never this worker's
+    threads or event loop. Raises ``asyncio.TimeoutError`` on timeout.
+    """
+    executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        return await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(executor, func), timeout)
+    except BaseException:
+        # Timed out or cancelled (e.g. shutdown): shutdown() alone would wait for the running job
+        for process in list(executor._processes.values()):
+            process.kill()
+        raise
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class IngestHandler(BaseHandler):
+    async def post(self):
+        from functools import partial
+        from rag.ingest import IngestBusy, ingest
+
+        body = self.body_json()
+        run = partial(
+            ingest,
+            data_dir=self.options.data_dir,
+            storage_dir=self.options.storage_dir,
+            chunk_size=self.body_int(body, "chunk_size", 500),
+            chunk_overlap=self.body_int(body, "chunk_overlap", 50),
+            embedding_model=body.get("embedding_model", DEFAULT_EMBEDDING_MODEL),
+            incremental=bool(body.get("incremental", True)),
+            index_type=body.get("index_type", "auto"),
+            embed_workers=self.body_int(body, "embed_workers", 1),
+        )
+        try:
+            # ingest() holds a lock on the storage directory, so this covers every worker
+            stats = await run_in_subprocess(run, self.options.ingest_timeout)
+        except IngestBusy as e:
+            raise tornado.web.HTTPError(409, reason=str(e))
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, reason=str(e))  # e.g. unknown index_type
+        except asyncio.TimeoutError:
+            raise tornado.web.HTTPError(504, reason=f"Ingest timed out after {self.options.ingest_timeout:g} s")
+        except BrokenProcessPool:
+            raise tornado.web.HTTPError(503, reason="Ingest process died")
+        self.finish(stats)
+
+
+def make_app(options: argparse.Namespace) -> tornado.web.Application:
+    return tornado.web.Application([
+        (r"/health", HealthHandler),
+        (r"/metrics", MetricsHandler),
+        (r"/retrieve", RetrieveHandler),
+        (r"/answer", AnswerHandler),
+        (r"/ingest", IngestHandler),
+    ], options=options)
+
+
+def warm_up(options: argparse.Namespace) -> None:
+    """Load the embedder, index and chat models before serving the first request"""
+    from rag.llm_client import embed_array
+    from rag.rag_core import get_cached_index
+    from rag.residency import preload_models
+
+    try:
+        embed_array(["warm up"], model=options.embedding_model, persist=False)
+        get_cached_index(options.storage_dir)
+        print(f"🔥 Worker {os.getpid()} ready")
+    except Exception as e:
+        print(f"⚠️  Worker {os.getpid()} warm-up incomplete: {e}")
+
+    models = [m.strip() for m in options.preload_models.split(",") if m.strip()]
+    for model, endpoints in preload_models(models).items():
+        for url, result in endpoints.items():
+            print(f"🔥 {model} warm on {url} ({result:.0f} ms)" if isinstance(result, float)
+                  else f"⚠️  {model} not warmed on {url}: {result}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="AskAce headless query service")
+    parser.add_argument("--host", default=os.getenv("RAG_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("RAG_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("RAG_WORKERS", "1")),
+                        help="Worker processes sharing the port (0 = one per CPU, Unix only)")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--storage-dir", default="storage")
+    parser.add_argument("--embedding-model", default=DEFAULT_EMBEDDING_MODEL,
+                        help="Model loaded at startup")
+    parser.add_argument("--preload-models", default=os.getenv("RAG_PRELOAD_MODELS", DEFAULT_CHAT_MODEL),
+                        help="Comma-separated chat models to load and warm at startup")
+    parser.add_argument("--ingest-timeout", type=float, default=float(os.getenv("RAG_INGEST_TIMEOUT", "3600")),
+                        help="Seconds before a POST /ingest is killed (504)")
+    return parser.parse_args(argv)
+
+
+def supervise(workers: int) -> int | None:
+    """Fork ``workers`` processes (0 = one per CPU) and supervise them
+
+    Returns None in each worker. The master forwards SIGINT, SIGTERM and
+    SIGHUP to every worker, restarts workers that crash and returns the
+    exit code once all of them have stopped.
+    """
+    forwarded = [signal.SIGINT, signal.SIGTERM, signal.SIGHUP]
+    children = set()
+    stopping = False
+
+    def forward(signum, frame):
+        nonlocal stopping
+        if signum != signal.SIGHUP:
+            stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def spawn() -> bool:
+        # Block signals across fork so a worker never runs the master's handler
+        signal.pthread_sigmask(signal.SIG_BLOCK, forwarded)
+        try:
+            pid = os.fork()
+            if pid == 0:
+                for sig in forwarded:
+                    signal.signal(sig, signal.SIG_DFL)
+                return True
+            children.add(pid)
+            return False
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, forwarded)
+
+    for sig in forwarded:
+        signal.signal(sig, forward)
+    for _ in range(workers or os.cpu_count() or 1):
+        if spawn():
+            return None
+
+    while children:
+        pid, status = os.wait()
+        children.discard(pid)
+        code = os.waitstatus_to_exitcode(status)
+        if code != 0 and not stopping:
+            print(f"⚠️  Worker {pid} exited with {code}; restarting")
+            if spawn():
+                return None
+    return 0
+
+
+def main(argv=None) -> int:
+    options = parse_args(argv)
+    Path(options.data_dir).mkdir(exist_ok=True)
+    Path(options.storage_dir).mkdir(exist_ok=True)
+
+    workers = options.workers
+    if workers != 1 and not hasattr(os, "fork"):
+        print("⚠️  Multiple workers need fork(); running a single worker")
+        workers = 1
+
+    # Bind before forking so every worker accepts on the same socket
+    sockets = tornado.netutil.bind_sockets(options.port, address=options.host)
+    if workers != 1:
+        print(f"🛰️  AskAce API on http://{options.host}:{options.port} ({workers or os.cpu_count()} workers)")
+        code = supervise(workers)
+        if code is not None:
+            return code  # Master: every worker has stopped
+
+    async def serve():
+        from rag.rag_core import clear_index_cache
+
+        server = tornado.httpserver.HTTPServer(make_app(options), idle_connection_timeout=75)
+        server.add_sockets(sockets)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, warm_up, options)
+
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+        if hasattr(signal, "SIGHUP"):
+            loop.add_signal_handler(signal.SIGHUP, clear_index_cache)
+
+        await stop.wait()
+        # Graceful shutdown: stop accepting, let in-flight requests finish (up to 30 s)
+        server.stop()
+        for _ in range(300):
+            if BaseHandler.inflight <= 0:
+                break
+            await asyncio.sleep(0.1)
+        await server.close_all_connections()
+
+    if workers == 1:
+        print(f"🛰️  AskAce API on http://{options.host}:{options.port} (1 worker)")
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    print(f"👋 Worker {os.getpid()} stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
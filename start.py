@@ -53,6 +53,10 @@ def main():
     
     check_ollama()
     
+    # Load the chat model(s) while Streamlit starts, so the first question is not a cold start
+    from rag.residency import warm_in_background
+    warm_in_background()
+    
     print("🚀 Launching optimized interface...")
     
     # Launch with performance-optimized flags